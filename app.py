@@ -1,15 +1,20 @@
 import streamlit as st
 import os
 import json
-# import whisper  # Commented out - will load on demand
-from gtts import gTTS
-from io import BytesIO
 import base64
+import hashlib
+import time
 from audio_recorder_streamlit import audio_recorder
-from rag_engine import RAGEngine
-from database import init_db, save_score, get_weak_topics, get_performance_history, save_achievement, get_achievements
-import pytesseract
-from PIL import Image
+from rag_engine import RAGEngine, latency_stats
+import resources
+from database import (init_db, save_score, get_weak_topics, get_performance_history, save_achievement,
+                      get_achievements, get_documents, find_document_by_hash, get_document,
+                      add_document_alias, get_document_aliases)
+from jobs import IngestJobRunner
+from ocr import ocr_stats
+from voice_reply import VoiceReply, voice_stats
+from ingest import document_key
+from conversation_memory import ConversationMemory
 
 # ────────────────────────────────────────────────
 #  Page config & styling
@@ -502,10 +507,25 @@ st.markdown("""
 #  Session state initialization
 # ────────────────────────────────────────────────
 
-if 'rag' not in st.session_state:
+@st.cache_resource
+def get_rag_engine():
+    # Runs once per process; the engine and its models are shared by all sessions
     init_db()
-    st.session_state.rag = RAGEngine()
     os.makedirs("uploads", exist_ok=True)
+    if os.getenv("MINDGAP_WARMUP", "1") == "1":
+        resources.warm_up(background=True)
+    return RAGEngine()
+
+@st.cache_resource
+def get_ingest_runner():
+    return IngestJobRunner(get_rag_engine())
+
+if 'rag' not in st.session_state:
+    st.session_state.rag = get_rag_engine()
+
+# Start the ingest workers with the process, not on the first visit to the
+# upload page, so jobs queued or interrupted before a restart resume at once
+get_ingest_runner()
 
 if 'student_profile' not in st.session_state:
     st.session_state.student_profile = {
@@ -517,10 +537,10 @@ if 'student_profile' not in st.session_state:
 if 'conversation_history' not in st.session_state:
     st.session_state.conversation_history = []
 
-# Whisper model will be loaded on-demand when voice input is used
-# if 'whisper_model' not in st.session_state:
-#     with st.spinner("Loading Whisper model (first time only)..."):
-#         st.session_state.whisper_model = whisper.load_model("base")
+# Bounded memory (rolling summary + recent turns) used for prompts; the
+# full conversation_history above is only used to display the chat
+if 'memory' not in st.session_state:
+    st.session_state.memory = ConversationMemory(summarize_fn=st.session_state.rag.summarize_conversation)
 
 # ────────────────────────────────────────────────
 #  Sidebar
@@ -554,53 +574,54 @@ with st.sidebar:
     st.session_state.student_profile["difficulty"] = diff
     st.session_state.student_profile["language"] = lang
 
+    with st.expander("🩺 System status"):
+        if resources.startup_timings:
+            for name, seconds in list(resources.startup_timings.items()):
+                st.caption(f"{name}: {seconds:.2f}s")
+        else:
+            st.caption("Models load on first use.")
+        latency = latency_stats()
+        if latency["requests"]:
+            st.caption(f"LLM latency (p50): first token {latency['ttft_p50'] or 0:.2f}s • "
+                       f"total {latency['total_p50']:.2f}s over {latency['requests']} requests • "
+                       f"~{latency['prompt_tokens_avg']:.0f} prompt tokens")
+        llm = resources.get_llm_client().stats
+        st.caption(f"LLM calls: {llm['requests']} • {llm['retries']} retries • "
+                   f"{llm['rate_limited']} rate-limit waits • {llm['failures']} failures")
+        responses = resources.get_response_cache().stats()
+        st.caption(f"Response cache: {responses['hit_rate']:.0%} hits • {responses['seconds_saved']:.0f}s saved")
+        cache = resources.get_embedder().stats()
+        st.caption(f"Embedding cache: {cache['hit_rate']:.0%} hits "
+                   f"({cache['memory_hits'] + cache['disk_hits']} hits / {cache['misses']} misses)")
+        if resources.is_loaded("reranker"):
+            rerank = resources.get_reranker().stats()
+            if rerank["queries"]:
+                st.caption(f"Reranker: p50 {rerank['p50_ms']:.0f}ms • p95 {rerank['p95_ms']:.0f}ms • "
+                           f"fallback {rerank['fallback_rate']:.0%}")
+        ocr_counts = ocr_stats()
+        if ocr_counts["pages"]:
+            st.caption(f"OCR: {ocr_counts['pages']} pages • {ocr_counts['cache_hits']} cached • "
+                       f"{ocr_counts['failures']} failed • {ocr_counts['pages_per_second'] or 0:.2f} pages/s per worker")
+        if resources.is_loaded("speech_recognizer"):
+            speech = resources.get_speech_recognizer().stats()
+            if speech["requests"]:
+                st.caption(f"Speech-to-text: p50 {speech['transcribe_p50']:.2f}s • "
+                           f"p95 {speech['transcribe_p95']:.2f}s • queue wait {speech['queue_wait_p50']:.2f}s")
+        voice = voice_stats()
+        if voice["replies"]:
+            st.caption(f"Voice replies: first audio p50 {voice['first_audio_p50']:.2f}s • "
+                       f"p95 {voice['first_audio_p95']:.2f}s • first sentence {voice['first_sentence_p50']:.2f}s")
+        memory = resources.memory_report()
+        if memory:
+            st.caption("Memory: " + " • ".join(f"{name} {size / 2**20:.1f} MB" for name, size in memory.items()))
+
 # ────────────────────────────────────────────────
 #  Pages
 # ────────────────────────────────────────────────
 
-if menu == "🏠 Home & Lessons":
-    st.markdown("""
-        <div style='text-align: center; padding: 2rem 0;'>
-            <div class='floating' style='font-size: 5rem; margin-bottom: 1rem;'>🎓</div>
-            <h1 class='gradient-text' style='font-size: 3.5rem;'>Bridge Your Knowledge Gaps</h1>
-            <p class='neon-text' style='font-size: 1.2rem; margin-top: 1rem;'>Personalized AI-powered learning at your fingertips</p>
-        </div>
-    """, unsafe_allow_html=True)
-
-    st.markdown("<div style='height: 2rem;'></div>", unsafe_allow_html=True)
-    
-    topic = st.text_input("💡 What would you like to learn today?", 
-                          placeholder="e.g. Python decorators, Photosynthesis, Blockchain...",
-                          label_visibility="visible")
-
-    if st.button("✨ Generate Lesson + Quiz", use_container_width=True) and topic.strip():
-        with st.spinner("🔮 Creating personalized lesson..."):
-            chunks = st.session_state.rag.search(topic)
-            context = "\n".join(chunks)
-
-            lesson_text = st.session_state.rag.generate_response(
-                topic, context, st.session_state.student_profile, st.session_state.conversation_history
-            )
-
-            quiz_data = st.session_state.rag.generate_quiz(
-                topic, context, st.session_state.student_profile
-            )
-
-            st.session_state.current_topic = topic
-            st.session_state.current_lesson = lesson_text
-            st.session_state.current_quiz = quiz_data
-
-    if 'current_lesson' in st.session_state:
-        st.markdown("<div style='height: 2rem;'></div>", unsafe_allow_html=True)
-        
-        with st.container():
-            st.markdown(f"""
-                <div class='glass-card'>
-                    <h2 style='color: white; margin-bottom: 1rem;'>📚 Lesson: <span class='neon-text'>{st.session_state.current_topic}</span></h2>
-                </div>
-            """, unsafe_allow_html=True)
-            
-            st.markdown(f"""
+def lesson_card_html(lesson):
+    # White lesson card; re-rendered on every delta while the lesson streams
+    return f"""
                 <div class='glass-card' style='background: white; color: #000000; padding: 2.5rem; line-height: 1.8; font-size: 1.05rem;'>
                     <style>
                         .glass-card h1, .glass-card h2, .glass-card h3 {{
@@ -667,9 +688,82 @@ if menu == "🏠 Home & Lessons":
                             font-weight: 600;
                         }}
                     </style>
-                    {st.session_state.current_lesson}
+                    {lesson}
+                </div>
+            """
+
+
+if menu == "🏠 Home & Lessons":
+    st.markdown("""
+        <div style='text-align: center; padding: 2rem 0;'>
+            <div class='floating' style='font-size: 5rem; margin-bottom: 1rem;'>🎓</div>
+            <h1 class='gradient-text' style='font-size: 3.5rem;'>Bridge Your Knowledge Gaps</h1>
+            <p class='neon-text' style='font-size: 1.2rem; margin-top: 1rem;'>Personalized AI-powered learning at your fingertips</p>
+        </div>
+    """, unsafe_allow_html=True)
+
+    st.markdown("<div style='height: 2rem;'></div>", unsafe_allow_html=True)
+    
+    topic = st.text_input("💡 What would you like to learn today?", 
+                          placeholder="e.g. Python decorators, Photosynthesis, Blockchain...",
+                          label_visibility="visible")
+
+    documents = get_documents()
+    scope = st.selectbox("📄 Search in", ["All materials"] + [d["file_name"] for d in documents])
+    scope_doc_id = None if scope == "All materials" else document_key(scope)
+
+    if st.button("✨ Generate Lesson + Quiz", use_container_width=True) and topic.strip():
+        with st.spinner("🔮 Creating personalized lesson..."):
+            # Hits go to the prompt builder as a list so it can dedupe and trim them; hits
+            # below the relevance threshold are already dropped
+            context = st.session_state.rag.search(topic, doc_id=scope_doc_id)
+
+            # The quiz is generated in the background while the lesson streams
+            # into the lesson card below; the quiz is picked up after it
+            st.session_state.pending_quiz = st.session_state.rag.start_quiz(
+                topic, context, st.session_state.student_profile
+            )
+            st.session_state.pending_lesson = (topic, context)
+            st.session_state.current_sources = list(dict.fromkeys(
+                f"{hit['source']} p.{hit['page_start']}" if hit['page_start'] else hit['source']
+                for hit in context if hit['source']
+            ))
+            st.session_state.current_topic = topic
+            st.session_state.current_lesson = ""
+            st.session_state.current_quiz = []
+
+    if 'current_lesson' in st.session_state:
+        st.markdown("<div style='height: 2rem;'></div>", unsafe_allow_html=True)
+        
+        with st.container():
+            st.markdown(f"""
+                <div class='glass-card'>
+                    <h2 style='color: white; margin-bottom: 1rem;'>📚 Lesson: <span class='neon-text'>{st.session_state.current_topic}</span></h2>
                 </div>
             """, unsafe_allow_html=True)
+            
+            lesson_slot = st.empty()
+            if st.session_state.get('pending_lesson'):
+                topic_text, context = st.session_state.pending_lesson
+                lesson_text = ""
+                for delta in st.session_state.rag.stream_response(
+                    topic_text, context, st.session_state.student_profile, st.session_state.memory,
+                    use_cache=True
+                ):
+                    lesson_text += delta
+                    lesson_slot.markdown(lesson_card_html(lesson_text), unsafe_allow_html=True)
+                st.session_state.current_lesson = lesson_text.strip()
+                st.session_state.memory.add_turn(topic_text, st.session_state.current_lesson)
+                st.session_state.pending_lesson = None
+            lesson_slot.markdown(lesson_card_html(st.session_state.current_lesson), unsafe_allow_html=True)
+            sources = st.session_state.get('current_sources') or []
+            if sources:
+                st.caption("Sources: " + " • ".join(sources))
+
+        if st.session_state.get('pending_quiz') is not None:
+            with st.spinner("🎯 Preparing your quiz..."):
+                st.session_state.current_quiz = st.session_state.pending_quiz.result()
+            st.session_state.pending_quiz = None
 
         if st.session_state.current_quiz:
             st.markdown("<div style='height: 1rem;'></div>", unsafe_allow_html=True)
@@ -744,29 +838,84 @@ elif menu == "📤 Upload Materials":
     
     st.markdown("<div style='height: 2rem;'></div>", unsafe_allow_html=True)
 
-    file = st.file_uploader("📎 Select file to upload", type=["pdf","txt","png","jpg","jpeg"])
+    files = st.file_uploader("📎 Select files to upload", type=["pdf","txt","png","jpg","jpeg"],
+                             accept_multiple_files=True)
 
-    if file and st.button("🚀 Process File", use_container_width=True):
-        path = os.path.join("uploads", file.name)
-        with open(path, "wb") as f:
-            f.write(file.getbuffer())
+    if files and st.button("🚀 Process Files", use_container_width=True):
+        runner = get_ingest_runner()
+        queued = 0
+        for file in files:
+            # Identical content is already in the knowledge base: skip without queueing,
+            # remembering a new name as an alias so removing the original can't drop it
+            duplicate = find_document_by_hash(hashlib.sha256(file.getbuffer()).hexdigest())
+            if duplicate:
+                if duplicate["file_name"] != file.name and not get_document(file.name):
+                    add_document_alias(file.name, duplicate["id"])
+                    st.info(f"⏭️ {file.name} has the same content as {duplicate['file_name']} — skipped")
+                else:
+                    st.info(f"⏭️ {file.name} is already indexed — skipped")
+                continue
+            path = os.path.join("uploads", file.name)
+            with open(path, "wb") as f:
+                f.write(file.getbuffer())
+            runner.submit(file.name, path, file.type)
+            queued += 1
+        if queued:
+            st.success(f"✅ Queued {queued} file(s) for indexing")
 
-        ocr_text = ""
-        if file.type.startswith("image/"):
-            try:
-                img = Image.open(path)
-                ocr_text = pytesseract.image_to_string(img)
-            except:
-                st.warning("⚠️ Could not perform OCR on image.")
+    # Indexing runs in background workers; this section only polls job state
+    jobs = get_ingest_runner().jobs()
+    if jobs:
+        st.markdown("<div style='height: 1rem;'></div>", unsafe_allow_html=True)
+        st.markdown("""
+            <div class='glass-card'>
+                <h3 style='color: white;'>📋 Indexing Jobs</h3>
+            </div>
+        """, unsafe_allow_html=True)
 
-        with st.spinner("🔄 Indexing content..."):
-            count = st.session_state.rag.process_file(path, ocr_text)
-            st.markdown(f"""
-                <div class='glass-card glow' style='text-align: center; background: rgba(46, 213, 115, 0.3);'>
-                    <h2 class='neon-text'>✅ Success!</h2>
-                    <p style='color: white; font-size: 1.2rem;'>Added <strong>{count}</strong> chunks to knowledge base</p>
-                </div>
-            """, unsafe_allow_html=True)
+        status_icons = {"queued": "⏳", "running": "🔄", "done": "✅", "skipped": "⏭️", "failed": "❌"}
+        for job in jobs:
+            icon = status_icons.get(job["status"], "•")
+            label = f"{icon} {job['file_name']} • {job['chunks_done']} chunks"
+            if job["status"] == "running" and job["total_pages"]:
+                st.progress(job["pages_done"] / job["total_pages"],
+                            text=f"{label} • page {job['pages_done']}/{job['total_pages']}")
+            elif job["status"] == "failed":
+                st.error(f"{label} • {job['error']}")
+            else:
+                st.caption(label)
+
+        active = any(job["status"] in ("queued", "running") for job in jobs)
+        if active and st.checkbox("🔁 Auto-refresh", value=True):
+            time.sleep(2)
+            st.rerun()
+        elif st.button("🔄 Refresh status"):
+            st.rerun()
+
+    documents = get_documents()
+    if documents:
+        st.markdown("<div style='height: 1rem;'></div>", unsafe_allow_html=True)
+        st.markdown("""
+            <div class='glass-card'>
+                <h3 style='color: white;'>🗂️ Knowledge Base</h3>
+            </div>
+        """, unsafe_allow_html=True)
+
+        for doc in documents:
+            col_name, col_delete = st.columns([5, 1])
+            col_name.caption(f"📄 {doc['file_name']} • {doc['chunk_count']} chunks • {doc['indexed_at'][:10]}")
+            if col_delete.button("🗑️", key=f"delete_doc_{doc['id']}", help="Remove from knowledge base"):
+                try:
+                    st.session_state.rag.remove_document(doc["file_name"])
+                    st.rerun()
+                except ValueError as e:
+                    st.warning(str(e))
+            for alias in get_document_aliases(doc["id"]):
+                col_name, col_delete = st.columns([5, 1])
+                col_name.caption(f"↳ {alias} • same content as {doc['file_name']}")
+                if col_delete.button("🗑️", key=f"delete_alias_{alias}", help="Remove this name"):
+                    st.session_state.rag.remove_document(alias)
+                    st.rerun()
 
 # ────────────────────────────────────────────────
 #  Dashboard
@@ -880,7 +1029,7 @@ elif menu == "🗣️ Voice Conversation":
         with st.chat_message("assistant"):
             st.write(msg["ai"])
             if "audio_data" in msg:
-                st.audio(msg["audio_data"], format="audio/mp3")
+                st.audio(msg["audio_data"], format=msg.get("audio_format", "audio/mp3"))
 
     # Live microphone recording
     st.markdown("""
@@ -920,20 +1069,9 @@ elif menu == "🗣️ Voice Conversation":
         if audio_bytes:
             with st.spinner("Transcribing your voice..."):
                 try:
-                    # Save temp file
-                    tmp_audio = "temp_voice_input.wav"
-                    with open(tmp_audio, "wb") as f:
-                        f.write(audio_bytes)
-
-                    # Load whisper model if not loaded
-                    if 'whisper_model' not in st.session_state:
-                        import whisper
-                        with st.spinner("Loading speech recognition model (first time only)..."):
-                            st.session_state.whisper_model = whisper.load_model("base")
-
-                    # Whisper → text
-                    result = st.session_state.whisper_model.transcribe(tmp_audio, language="en")
-                    user_speech = result["text"].strip()
+                    # Speech → text on the shared recognizer (one model per process);
+                    # the recording is decoded in memory, never written to disk
+                    user_speech = resources.get_speech_recognizer().transcribe(audio_bytes, language="en")
 
                     if not user_speech:
                         st.warning("Could not understand speech. Try speaking more clearly.")
@@ -943,35 +1081,36 @@ elif menu == "🗣️ Voice Conversation":
                         # Get context + generate answer
                         with st.spinner("Thinking..."):
                             ctx_chunks = st.session_state.rag.search(user_speech)
-                            context_str = "\n".join(ctx_chunks)
-
-                            ai_text = st.session_state.rag.generate_response(
-                                user_speech,
-                                context_str,
-                                st.session_state.student_profile,
-                                st.session_state.conversation_history
+                            lang_code = {"English":"en", "Spanish":"es", "French":"fr"}.get(
+                                st.session_state.student_profile["language"], "en"
                             )
+                            reply = VoiceReply(lang=lang_code)
 
-                            st.chat_message("assistant").write(ai_text)
+                            # Render the answer while it is generated; each sentence is
+                            # synthesized as soon as it ends and its audio shown in order
+                            with st.chat_message("assistant"):
+                                text_box, audio_box = st.container(), st.container()
 
-                            # Text → Speech
-                            try:
-                                lang_code = {"English":"en", "Spanish":"es", "French":"fr"}.get(
-                                    st.session_state.student_profile["language"], "en"
-                                )
-                                tts = gTTS(ai_text, lang=lang_code, slow=False)
-                                audio_io = BytesIO()
-                                tts.write_to_fp(audio_io)
-                                audio_io.seek(0)
+                                def play(chunk):
+                                    audio_box.audio(chunk, format=reply.mime)
 
-                                st.audio(audio_io, format="audio/mp3")
+                                ai_text = text_box.write_stream(reply.speak(
+                                    st.session_state.rag.stream_response(
+                                        user_speech,
+                                        ctx_chunks,
+                                        st.session_state.student_profile,
+                                        st.session_state.memory
+                                    ),
+                                    on_audio=play
+                                )).strip()
+                            st.session_state.memory.add_turn(user_speech, ai_text)
 
-                                # Save to history
-                                st.session_state.conversation_history.append({
-                                    "user": user_speech,
-                                    "ai": ai_text,
-                                    "audio_data": audio_io.getvalue()
-                                })
+                            try:
+                                audio_data = reply.finish(on_audio=play)
+                                turn = {"user": user_speech, "ai": ai_text}
+                                if audio_data:
+                                    turn.update(audio_data=audio_data, audio_format=reply.mime)
+                                st.session_state.conversation_history.append(turn)
 
                             except Exception as e:
                                 st.error(f"TTS failed: {e}")
@@ -983,7 +1122,3 @@ elif menu == "🗣️ Voice Conversation":
 
                 except Exception as e:
                     st.error(f"Voice transcription failed: {e}")
-                finally:
-                    # Cleanup
-                    if os.path.exists(tmp_audio):
-                        os.remove(tmp_audio)
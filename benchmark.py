@@ -0,0 +1,223 @@
+"""
+Throughput benchmarks against the configured index.
+
+    python benchmark.py search --queries queries.txt --batch-size 32
+    python benchmark.py embed --backends torch onnx onnx-int8
+    python benchmark.py ocr scan.pdf photo.jpg --workers 4
+    python benchmark.py pdf textbook.pdf
+"""
+import os
+import argparse
+import random
+import time
+
+import numpy as np
+
+import resources
+
+
+def sample_texts(n):
+    """
+    Random chunk texts from the local corpus
+    """
+    if resources.pinecone_enabled():
+        return []
+    texts = []
+    for rows in resources.get_local_store().iter_chunks():
+        texts.extend(row[1] for row in rows)
+    random.shuffle(texts)
+    return texts[:n]
+
+
+def sample_queries(n):
+    """
+    Build queries from the first words of locally indexed chunks when no
+    query file is given
+    """
+    return [" ".join(t.split()[:8]) for t in sample_texts(n)]
+
+
+def bench_search(args):
+    from rag_engine import RAGEngine
+    rag = RAGEngine()
+    if args.queries:
+        with open(args.queries, encoding='utf-8') as f:
+            queries = [line.strip() for line in f if line.strip()][:args.n]
+    else:
+        queries = sample_queries(args.n)
+    if not queries:
+        print("No queries: index some documents or pass --queries")
+        return
+
+    rag.search_many(queries[:1], args.top_k)  # load the models outside the timed runs
+    # Otherwise the first run fills the embedding cache and the second only reads it
+    embedder = resources.get_embedder()
+    embedder.enabled = False
+
+    start = time.perf_counter()
+    for query in queries:
+        rag.search(query, args.top_k)
+    sequential = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(0, len(queries), args.batch_size):
+        rag.search_many(queries[i:i + args.batch_size], args.top_k)
+    batched = time.perf_counter() - start
+    embedder.enabled = True
+
+    print(f"{len(queries)} queries, top_k={args.top_k}")
+    print(f"search:      {len(queries) / sequential:8.1f} queries/s")
+    print(f"search_many: {len(queries) / batched:8.1f} queries/s (batch size {args.batch_size})")
+
+
+def _top_k(queries, docs, k):
+    # Vectors from the backends are not all unit length; compare by cosine
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    docs = docs / np.linalg.norm(docs, axis=1, keepdims=True)
+    return np.argsort(-(queries @ docs.T), axis=1)[:, :k]
+
+
+def bench_embed(args):
+    """
+    Encode throughput per backend, and how closely each one reproduces the
+    reference (first) backend: mean cosine between the two vectors of the
+    same text, and overlap of the top-k chunks retrieved for each query
+    """
+    from embedding_backend import Embedder
+    if args.texts:
+        with open(args.texts, encoding='utf-8') as f:
+            docs = [line.strip() for line in f if line.strip()][:args.n]
+    else:
+        docs = sample_texts(args.n)
+    if len(docs) <= args.top_k:
+        print("Not enough texts: index some documents or pass --texts")
+        return
+    queries = [" ".join(t.split()[:8]) for t in docs[:args.queries]]
+
+    reference = None
+    for backend in args.backends:
+        try:
+            model = Embedder(resources.EMBED_MODEL_NAME, backend=backend, threads=args.threads)
+        except Exception as e:
+            print(f"{backend:11s} unavailable: {e}")
+            continue
+        model.encode(docs[:8])  # warm-up
+        start = time.perf_counter()
+        doc_vectors = model.encode(docs)
+        elapsed = time.perf_counter() - start
+        query_vectors = model.encode(queries)
+        top = _top_k(query_vectors, doc_vectors, args.top_k)
+
+        line = f"{backend:11s} {len(docs) / elapsed:8.1f} texts/s"
+        if reference is None:
+            reference = (args.backends[0], doc_vectors, top)
+        else:
+            name, ref_vectors, ref_top = reference
+            a = doc_vectors / np.linalg.norm(doc_vectors, axis=1, keepdims=True)
+            b = ref_vectors / np.linalg.norm(ref_vectors, axis=1, keepdims=True)
+            overlap = np.mean([len(set(x) & set(y)) / args.top_k for x, y in zip(top, ref_top)])
+            line += f"  cosine vs {name} {np.mean((a * b).sum(axis=1)):.4f}  top-{args.top_k} agreement {overlap:.1%}"
+        print(line)
+
+
+def bench_ocr(args):
+    """
+    Wall-clock OCR throughput over image files and the images of scanned
+    PDF pages, bypassing the OCR cache
+    """
+    import ocr
+    from pdf_extract import open_pdf
+    images = []
+    for path in args.paths:
+        if path.lower().endswith('.pdf'):
+            reader = open_pdf(path)
+            for n in range(len(reader)):
+                images.extend(reader.images(n))
+            reader.close()
+        else:
+            with open(path, 'rb') as f:
+                images.append(f.read())
+    if not images:
+        print("No images to OCR")
+        return
+    for workers in sorted({1, args.workers}):
+        start = time.perf_counter()
+        ocr.ocr_images(images, workers=workers, use_cache=False)
+        elapsed = time.perf_counter() - start
+        print(f"{workers:2d} worker(s): {len(images) / elapsed:6.2f} pages/s ({len(images)} pages, {elapsed:.1f}s)")
+
+
+def bench_pdf(args):
+    """
+    Pages per second for each installed PDF backend against PyPDF2, how
+    much of PyPDF2's text each one recovers, and a page-cache read
+    """
+    import pdf_extract
+    from ingest import file_sha256
+
+    baseline = None
+    for backend in ["PyPDF2"] + [b for b in pdf_extract.available_backends() if b != "PyPDF2"]:
+        start = time.perf_counter()
+        try:
+            reader = pdf_extract.open_pdf(args.path, backend)
+        except Exception as e:
+            print(f"{backend:10s} unavailable: {e}")
+            continue
+        pages = [reader.text(n) for n in range(len(reader))]
+        reader.close()
+        elapsed = time.perf_counter() - start
+        words = sum(len(p.split()) for p in pages)
+        line = f"{backend:10s} {len(pages) / elapsed:8.1f} pages/s  {words} words"
+        if baseline is None:
+            baseline = words
+        elif baseline:
+            line += f" ({words / baseline:.0%} of PyPDF2)"
+        print(line)
+
+    sha256 = file_sha256(args.path)
+    start = time.perf_counter()
+    total = pdf_extract.page_count(args.path, sha256)
+    cached = pdf_extract.cached_pages(sha256, 1, total + 1)
+    elapsed = time.perf_counter() - start
+    if len(cached) == total:
+        print(f"{'page cache':10s} {total / elapsed:8.1f} pages/s")
+    else:
+        print("page cache: file not indexed yet")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    search = commands.add_parser("search", help="sequential search vs batched search_many")
+    search.add_argument("--queries", help="text file with one query per line")
+    search.add_argument("-n", type=int, default=200, help="number of queries")
+    search.add_argument("--top-k", type=int, default=3)
+    search.add_argument("--batch-size", type=int, default=32)
+    search.set_defaults(run=bench_search)
+
+    embed = commands.add_parser("embed", help="embedding backend throughput and agreement")
+    embed.add_argument("--backends", nargs="+", default=["torch", "torch-int8", "onnx", "onnx-int8"],
+                       help="the first backend is the reference")
+    embed.add_argument("--texts", help="text file with one passage per line")
+    embed.add_argument("-n", type=int, default=1000, help="number of passages")
+    embed.add_argument("--queries", type=int, default=100)
+    embed.add_argument("--top-k", type=int, default=10)
+    embed.add_argument("--threads", type=int, default=0)
+    embed.set_defaults(run=bench_embed)
+
+    ocr_bench = commands.add_parser("ocr", help="OCR pages per second, single process vs pool")
+    ocr_bench.add_argument("paths", nargs="+", help="image files or scanned PDFs")
+    ocr_bench.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ocr_bench.set_defaults(run=bench_ocr)
+
+    pdf = commands.add_parser("pdf", help="PDF text extraction backends vs PyPDF2")
+    pdf.add_argument("path")
+    pdf.set_defaults(run=bench_pdf)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
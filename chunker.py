@@ -0,0 +1,195 @@
+import os
+import re
+
+from prompt_builder import count_tokens
+
+# all-MiniLM-L6-v2 truncates input at 256 word pieces; 200 tokens stays
+# under that, so every chunk is embedded whole.
+CHUNK_TOKENS = int(os.getenv("MINDGAP_CHUNK_TOKENS", "200"))
+CHUNK_OVERLAP = int(os.getenv("MINDGAP_CHUNK_OVERLAP", "30"))
+MIN_CHUNK_TOKENS = 50   # a page ending with less than this carries over into the next page
+
+_LINE_RE = re.compile(r'[^\n]*\n?')
+_FENCE_RE = re.compile(r'^\s*(```|~~~)')
+_MARKDOWN_HEADING_RE = re.compile(r'^#{1,6}\s+\S')
+_NUMBERED_HEADING_RE = re.compile(r'^(\d+(\.\d+)*\.?|chapter\s+\d+|section\s+\d+(\.\d+)*)\s+[A-Z]', re.I)
+_SENTENCE_RE = re.compile(r'\S.*?(?:[.!?]["\')\]]*(?=\s)|$)', re.S)
+_WORD_RE = re.compile(r'\S+')
+
+
+def _is_heading(line):
+    line = line.strip()
+    if not line or len(line) > 80:
+        return False
+    if _MARKDOWN_HEADING_RE.match(line):
+        return True
+    if line[-1] in ".,;:!?":
+        return False
+    if _NUMBERED_HEADING_RE.match(line) and len(line.split()) <= 10:
+        return True
+    letters = [c for c in line if c.isalpha()]
+    return len(letters) >= 4 and all(c.isupper() for c in letters) and len(line.split()) <= 8
+
+
+def _iter_blocks(pages):
+    """
+    Split a page stream into (kind, text, page, start, end) blocks, kind
+    being "heading", "paragraph", "code" or "page" (a page break marker).
+    Offsets are character positions within the page text.
+    """
+    in_code = False
+    for page_number, text in pages:
+        block, block_start, block_end = [], None, 0
+        kind = "code" if in_code else "paragraph"
+
+        def flush():
+            nonlocal block, block_start
+            if block and "".join(block).strip():
+                yield kind, "".join(block), page_number, block_start, block_end
+            block, block_start = [], None
+
+        pos = 0
+        for match in _LINE_RE.finditer(text):
+            line = match.group()
+            if not line:
+                break
+            start, pos = pos, pos + len(line)
+            if _FENCE_RE.match(line):
+                if in_code:
+                    block.append(line)
+                    block_end = pos
+                    yield from flush()
+                    in_code, kind = False, "paragraph"
+                else:
+                    yield from flush()
+                    in_code, kind = True, "code"
+                    block, block_start, block_end = [line], start, pos
+                continue
+            if in_code:
+                if block_start is None:
+                    block_start = start
+                block.append(line)
+                block_end = pos
+            elif not line.strip():
+                yield from flush()
+            elif _is_heading(line):
+                yield from flush()
+                yield "heading", line.strip().lstrip("#").strip(), page_number, start, pos
+            else:
+                if block_start is None:
+                    block_start = start
+                block.append(line)
+                block_end = pos
+        yield from flush()
+        yield "page", "", page_number, len(text), len(text)
+
+
+def _split_words(text, base, max_tokens):
+    """
+    Cut an over-long sentence or line into word runs of at most max_tokens
+    """
+    run, run_start, run_end, tokens = [], None, 0, 0
+    for match in _WORD_RE.finditer(text):
+        word_tokens = count_tokens(match.group())
+        if run and tokens + word_tokens > max_tokens:
+            yield " ".join(run), base + run_start, base + run_end
+            run, run_start, tokens = [], None, 0
+        if run_start is None:
+            run_start = match.start()
+        run.append(match.group())
+        run_end = match.end()
+        tokens += word_tokens
+    if run:
+        yield " ".join(run), base + run_start, base + run_end
+
+
+def _units(kind, text, start, max_tokens):
+    """
+    Break a block into (text, separator, start, end) units that each fit
+    in max_tokens: sentences for prose, lines for code
+    """
+    if kind == "code":
+        pieces = ((m.group().rstrip("\n"), m) for m in _LINE_RE.finditer(text) if m.group())
+        separator, first_separator = "\n", "\n\n"
+    else:
+        # PDF text breaks lines mid-sentence; sentences are re-flowed onto one line
+        pieces = ((" ".join(m.group().split()), m) for m in _SENTENCE_RE.finditer(text))
+        separator, first_separator = " ", "\n\n"
+
+    first = True
+    for piece, match in pieces:
+        if not piece.strip() and kind != "code":
+            continue
+        piece_start, piece_end = match.start(), match.end()
+        if count_tokens(piece) > max_tokens:
+            parts = _split_words(match.group(), start + piece_start, max_tokens)
+        else:
+            parts = [(piece, start + piece_start, start + piece_end)]
+        for part, part_start, part_end in parts:
+            yield part, first_separator if first else separator, part_start, part_end
+            first = False
+
+
+def iter_chunks(pages, max_tokens=CHUNK_TOKENS, overlap=CHUNK_OVERLAP, min_tokens=MIN_CHUNK_TOKENS):
+    """
+    Structure-aware chunking of a stream of (page_number, text) pairs in
+    one pass. Chunks hold at most max_tokens tokens, start at headings
+    (the heading leads the chunk), keep code blocks and sentences whole
+    where they fit, and end at page breaks unless shorter than min_tokens.
+    Chunks cut mid-section repeat up to overlap tokens of trailing
+    sentences. Yields {"text", "page_start", "page_end", "offset_start",
+    "offset_end"} dicts; offsets are character positions within the start
+    and end pages.
+    """
+    current = []        # [text, separator, tokens, page, start, end, is_overlap, is_heading]
+    tokens = 0
+
+    def emit():
+        text = "".join((u[1] if i else "") + u[0] for i, u in enumerate(current)).strip()
+        first, last = current[0], current[-1]
+        return {"text": text, "page_start": first[3], "page_end": last[3],
+                "offset_start": first[4], "offset_end": last[5]}
+
+    def has_content():
+        return any(not u[6] for u in current)
+
+    for kind, text, page_number, start, end in _iter_blocks(pages):
+        if kind == "page":
+            if tokens >= min_tokens and has_content():
+                yield emit()
+                current, tokens = [], 0
+            continue
+
+        if kind == "heading":
+            # A heading starts a new chunk, unless the open one holds only headings
+            if has_content() and not all(u[7] for u in current if not u[6]):
+                yield emit()
+                current, tokens = [], 0
+            else:
+                current = [u for u in current if not u[6]]
+                tokens = sum(u[2] for u in current)
+            heading_tokens = count_tokens(text)
+            if heading_tokens <= max_tokens:
+                current.append([text, "\n\n", heading_tokens, page_number, start, end, False, True])
+                tokens += heading_tokens
+            continue
+
+        for unit_text, separator, unit_start, unit_end in _units(kind, text, start, max_tokens):
+            unit_tokens = count_tokens(unit_text)
+            if current and tokens + unit_tokens > max_tokens and has_content():
+                yield emit()
+                # Carry the trailing sentences into the next chunk as overlap
+                carried, carried_tokens = [], 0
+                for u in reversed(current):
+                    if u[7] or carried_tokens + u[2] > overlap:
+                        break
+                    carried.insert(0, [u[0], u[1], u[2], u[3], u[4], u[5], True, False])
+                    carried_tokens += u[2]
+                if carried_tokens + unit_tokens > max_tokens:
+                    carried, carried_tokens = [], 0
+                current, tokens = carried, carried_tokens
+            current.append([unit_text, separator, unit_tokens, page_number, unit_start, unit_end, False, False])
+            tokens += unit_tokens
+
+    if has_content():
+        yield emit()
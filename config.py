@@ -0,0 +1,5 @@
+import os
+
+# Local index, caches and page/OCR databases live here. Kept free of heavy
+# imports so any module (including worker processes) can read it.
+DATA_DIR = os.getenv("MINDGAP_DATA_DIR", "index_data")
@@ -0,0 +1,83 @@
+import threading
+from collections import deque
+
+from prompt_builder import count_tokens, trim_to_tokens, summarize_turns
+
+RECENT_TURNS = 4          # turns kept verbatim
+SUMMARY_BATCH = 3         # evicted turns folded into the summary at once
+MAX_SUMMARY_TOKENS = 300
+
+
+class ConversationMemory:
+    """
+    Bounded conversation memory: a rolling summary plus the last few turns.
+
+    Turns that fall out of the recent window are queued and folded into the
+    summary in batches on a background thread, so the prompt built from
+    this memory stays the same size however long the conversation gets.
+    summarize_fn(summary, turns) returns the new summary; if it is missing
+    or fails, an extractive summary is used instead.
+    """
+
+    def __init__(self, summarize_fn=None, recent_turns=RECENT_TURNS, batch_size=SUMMARY_BATCH,
+                 max_summary_tokens=MAX_SUMMARY_TOKENS):
+        self.summarize_fn = summarize_fn
+        self.batch_size = batch_size
+        self.max_summary_tokens = max_summary_tokens
+        self.summary = ""
+        self._recent = deque()
+        self._recent_turns = recent_turns
+        self._pending = []
+        self._lock = threading.Lock()
+        self._updating = False
+
+    def add_turn(self, user, ai):
+        with self._lock:
+            self._recent.append({"user": user, "ai": ai})
+            while len(self._recent) > self._recent_turns:
+                self._pending.append(self._recent.popleft())
+            start = len(self._pending) >= self.batch_size and not self._updating
+            if start:
+                self._updating = True
+        if start:
+            threading.Thread(target=self._update_summary, daemon=True).start()
+
+    def _update_summary(self):
+        try:
+            while True:
+                with self._lock:
+                    batch = self._pending[:self.batch_size]
+                    summary = self.summary
+                if len(batch) < self.batch_size:
+                    return
+                try:
+                    new_summary = self.summarize_fn(summary, batch) if self.summarize_fn else None
+                except Exception as e:
+                    print(f"Conversation summary failed, using extractive fallback: {e}")
+                    new_summary = None
+                if not new_summary:
+                    # Extractive lines accumulate; drop the oldest so new turns always make it in
+                    lines = "\n".join(filter(None, [summary, summarize_turns(batch, self.max_summary_tokens)])).split("\n")
+                    while len(lines) > 1 and count_tokens("\n".join(lines)) > self.max_summary_tokens:
+                        lines.pop(0)
+                    new_summary = "\n".join(lines)
+                with self._lock:
+                    self.summary = trim_to_tokens(new_summary.strip(), self.max_summary_tokens)
+                    del self._pending[:len(batch)]
+        finally:
+            with self._lock:
+                self._updating = False
+
+    def summary_text(self):
+        """
+        Rolling summary plus one-line notes for turns not yet folded into it
+        """
+        with self._lock:
+            summary, pending = self.summary, list(self._pending)
+        if pending:
+            summary = "\n".join(filter(None, [summary, summarize_turns(pending, self.max_summary_tokens)]))
+        return summary
+
+    def recent_turns(self):
+        with self._lock:
+            return list(self._recent)
@@ -9,6 +9,8 @@ def init_db():
     - student_performance: stores quiz results
     - weak_topics: tracks topics the student struggles with
     - achievements: stores unlocked badges/achievements
+    - ingest_jobs: background upload/indexing jobs and their progress
+    - documents / document_chunks: content-hash manifest of indexed files
     """
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
@@ -44,6 +46,57 @@ def init_db():
         )
     ''')
     
+    # Background ingestion jobs (see jobs.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ingest_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            file_name TEXT NOT NULL,
+            path TEXT NOT NULL,
+            file_type TEXT,
+            status TEXT DEFAULT 'queued',
+            pages_done INTEGER DEFAULT 0,
+            total_pages INTEGER DEFAULT 0,
+            chunks_done INTEGER DEFAULT 0,
+            error TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Manifest of indexed files; sha256 is NULL until the first full index
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS documents (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            file_name TEXT UNIQUE NOT NULL,
+            path TEXT,
+            sha256 TEXT,
+            chunk_count INTEGER DEFAULT 0,
+            indexed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_documents_sha256 ON documents (sha256)')
+
+    # One row per chunk per indexed version of a document
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS document_chunks (
+            document_id INTEGER NOT NULL,
+            version TEXT NOT NULL,
+            ordinal INTEGER NOT NULL,
+            chunk_hash TEXT NOT NULL,
+            vector_id TEXT NOT NULL,
+            PRIMARY KEY (document_id, version, ordinal)
+        )
+    ''')
+
+    # Other names the same content was uploaded under; it is indexed once, as the document
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS document_aliases (
+            file_name TEXT PRIMARY KEY,
+            document_id INTEGER NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
     conn.commit()
     conn.close()
 
@@ -136,3 +189,242 @@ def get_achievements():
     rows = cursor.fetchall()
     conn.close()
     return [{"name": row[0], "date": row[1]} for row in rows]
+
+INGEST_JOB_FIELDS = ["id", "file_name", "path", "file_type", "status", "pages_done",
+                     "total_pages", "chunks_done", "error", "created_at", "updated_at"]
+
+def create_ingest_job(file_name, path, file_type):
+    """
+    Queue a file for background indexing and return the job id
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO ingest_jobs (file_name, path, file_type)
+        VALUES (?, ?, ?)
+    ''', (file_name, path, file_type))
+    job_id = cursor.lastrowid
+    conn.commit()
+    conn.close()
+    return job_id
+
+def claim_ingest_job(stale_minutes=10):
+    """
+    Atomically mark the oldest queued job as running and return it.
+    Running jobs with no progress for stale_minutes (e.g. the process
+    crashed) are claimed again so they resume.
+    """
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    cursor.execute(f'''
+        SELECT {", ".join(INGEST_JOB_FIELDS)}
+        FROM ingest_jobs
+        WHERE status = 'queued'
+           OR (status = 'running' AND updated_at < datetime('now', ?))
+        ORDER BY id
+        LIMIT 1
+    ''', (f"-{stale_minutes} minutes",))
+    row = cursor.fetchone()
+    if row:
+        cursor.execute('''
+            UPDATE ingest_jobs
+            SET status = 'running', updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', (row[0],))
+    conn.commit()
+    conn.close()
+    return dict(zip(INGEST_JOB_FIELDS, row)) if row else None
+
+def update_ingest_job(job_id, **fields):
+    """
+    Update status/progress columns of a job (also refreshes its heartbeat)
+    """
+    columns = [f"{name} = ?" for name in fields if name in INGEST_JOB_FIELDS]
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        UPDATE ingest_jobs
+        SET {", ".join(columns + ["updated_at = CURRENT_TIMESTAMP"])}
+        WHERE id = ?
+    ''', [fields[name] for name in fields if name in INGEST_JOB_FIELDS] + [job_id])
+    conn.commit()
+    conn.close()
+
+def get_ingest_jobs(limit=20):
+    """
+    Return recent ingestion jobs (newest first)
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT {", ".join(INGEST_JOB_FIELDS)}
+        FROM ingest_jobs
+        ORDER BY id DESC
+        LIMIT ?
+    ''', (limit,))
+    rows = cursor.fetchall()
+    conn.close()
+    return [dict(zip(INGEST_JOB_FIELDS, row)) for row in rows]
+
+DOCUMENT_FIELDS = ["id", "file_name", "path", "sha256", "chunk_count", "indexed_at"]
+
+def _fetch_document(where, params):
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute(f'SELECT {", ".join(DOCUMENT_FIELDS)} FROM documents WHERE {where} LIMIT 1', params)
+    row = cursor.fetchone()
+    conn.close()
+    return dict(zip(DOCUMENT_FIELDS, row)) if row else None
+
+def get_document(file_name):
+    """
+    Return the manifest entry for a file name, or None
+    """
+    return _fetch_document('file_name = ?', (file_name,))
+
+def find_document_by_hash(sha256):
+    """
+    Return a fully indexed document with this content hash, or None
+    """
+    return _fetch_document('sha256 = ?', (sha256,))
+
+def get_documents():
+    """
+    Return all fully indexed documents (newest first)
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT {", ".join(DOCUMENT_FIELDS)}
+        FROM documents
+        WHERE sha256 IS NOT NULL
+        ORDER BY indexed_at DESC
+    ''')
+    rows = cursor.fetchall()
+    conn.close()
+    return [dict(zip(DOCUMENT_FIELDS, row)) for row in rows]
+
+def upsert_document(file_name, path):
+    """
+    Create (or fetch) the manifest entry for a file and return its id
+    """
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO documents (file_name, path)
+        VALUES (?, ?)
+        ON CONFLICT(file_name) DO UPDATE SET path = excluded.path
+    ''', (file_name, path))
+    cursor.execute('SELECT id FROM documents WHERE file_name = ?', (file_name,))
+    doc_id = cursor.fetchone()[0]
+    conn.commit()
+    conn.close()
+    return doc_id
+
+def get_reusable_chunks(document_id, version):
+    """
+    Return (chunk_hash, vector_id) pairs from older versions of a document
+    whose vectors the new version hasn't already taken over
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT DISTINCT chunk_hash, vector_id
+        FROM document_chunks
+        WHERE document_id = ? AND version != ?
+          AND vector_id NOT IN (
+              SELECT vector_id FROM document_chunks WHERE document_id = ? AND version = ?
+          )
+    ''', (document_id, version, document_id, version))
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+def add_document_chunks(document_id, version, rows):
+    """
+    Record (ordinal, chunk_hash, vector_id) rows for a document version
+    """
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    cursor = conn.cursor()
+    cursor.executemany('''
+        INSERT OR REPLACE INTO document_chunks (document_id, version, ordinal, chunk_hash, vector_id)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(document_id, version, o, h, v) for o, h, v in rows])
+    conn.commit()
+    conn.close()
+
+def finalize_document(document_id, sha256, chunk_count):
+    """
+    Make a fully indexed version current. Drops the rows of older versions
+    and returns the vector ids only those versions used (to be deleted).
+    """
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT DISTINCT vector_id
+        FROM document_chunks
+        WHERE document_id = ? AND version != ?
+          AND vector_id NOT IN (
+              SELECT vector_id FROM document_chunks WHERE document_id = ? AND version = ?
+          )
+    ''', (document_id, sha256, document_id, sha256))
+    stale = [r[0] for r in cursor.fetchall()]
+    cursor.execute('DELETE FROM document_chunks WHERE document_id = ? AND version != ?', (document_id, sha256))
+    cursor.execute('''
+        UPDATE documents
+        SET sha256 = ?, chunk_count = ?, indexed_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+    ''', (sha256, chunk_count, document_id))
+    conn.commit()
+    conn.close()
+    return stale
+
+def delete_document(document_id):
+    """
+    Remove a document from the manifest and return all its vector ids
+    """
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    cursor = conn.cursor()
+    cursor.execute('SELECT DISTINCT vector_id FROM document_chunks WHERE document_id = ?', (document_id,))
+    vector_ids = [r[0] for r in cursor.fetchall()]
+    cursor.execute('DELETE FROM document_chunks WHERE document_id = ?', (document_id,))
+    cursor.execute('DELETE FROM documents WHERE id = ?', (document_id,))
+    conn.commit()
+    conn.close()
+    return vector_ids
+
+def add_document_alias(file_name, document_id):
+    """
+    Record that file_name was uploaded with the same content as a document
+    """
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    cursor = conn.cursor()
+    cursor.execute('INSERT OR REPLACE INTO document_aliases (file_name, document_id) VALUES (?, ?)',
+                   (file_name, document_id))
+    conn.commit()
+    conn.close()
+
+def get_document_aliases(document_id):
+    """
+    Return the other file names a document's content was uploaded under
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute('SELECT file_name FROM document_aliases WHERE document_id = ? ORDER BY file_name',
+                   (document_id,))
+    names = [r[0] for r in cursor.fetchall()]
+    conn.close()
+    return names
+
+def delete_document_alias(file_name):
+    """
+    Forget an alias; returns True if file_name was one
+    """
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM document_aliases WHERE file_name = ?', (file_name,))
+    deleted = cursor.rowcount > 0
+    conn.commit()
+    conn.close()
+    return deleted
@@ -0,0 +1,94 @@
+import os
+import numpy as np
+
+# "torch" (fp32, the reference), "torch-int8" (dynamically quantized Linear
+# layers), "onnx" (ONNX Runtime fp32) or "onnx-int8" (quantized ONNX export)
+EMBED_BACKEND = os.getenv("MINDGAP_EMBED_BACKEND", "torch")
+EMBED_THREADS = int(os.getenv("MINDGAP_EMBED_THREADS", "0"))   # 0 = library default
+# Padded tokens per forward pass; short texts get big batches, long ones small
+EMBED_BATCH_TOKENS = int(os.getenv("MINDGAP_EMBED_BATCH_TOKENS", "8192"))
+MAX_BATCH_SIZE = 256
+# The AVX2 build runs on any x86-64 host from the last decade
+ONNX_INT8_FILE = os.getenv("MINDGAP_EMBED_ONNX_FILE", "onnx/model_quint8_avx2.onnx")
+BACKENDS = ["torch", "torch-int8", "onnx", "onnx-int8"]
+
+
+def cache_name(model_name, backend=EMBED_BACKEND):
+    """
+    Embedding cache namespace; quantized backends produce slightly
+    different vectors, so they get their own cache entries
+    """
+    return model_name if backend == "torch" else f"{model_name}@{backend}"
+
+
+class Embedder:
+    """
+    Sentence-transformers model behind a configurable inference backend.
+
+    Texts are sorted by length and grouped into batches of roughly
+    batch_tokens padded tokens, so short queries are encoded in large
+    batches and long chunks don't pad a whole batch to their length.
+    """
+
+    def __init__(self, model_name, backend=EMBED_BACKEND, threads=EMBED_THREADS, batch_tokens=EMBED_BATCH_TOKENS):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {BACKENDS}")
+        self.model_name = model_name
+        self.backend = backend
+        self.threads = threads
+        self.batch_tokens = batch_tokens
+        self.model = self._load()
+        self.max_seq_length = self.model.max_seq_length or 256
+
+    def _load(self):
+        from sentence_transformers import SentenceTransformer
+        if self.backend.startswith("torch"):
+            import torch
+            if self.threads:
+                torch.set_num_threads(self.threads)
+            model = SentenceTransformer(self.model_name, device="cpu")
+            if self.backend == "torch-int8":
+                model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            return model
+
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        if self.threads:
+            options.intra_op_num_threads = self.threads
+        model_kwargs = {"provider": "CPUExecutionProvider", "session_options": options}
+        if self.backend == "onnx-int8":
+            model_kwargs["file_name"] = ONNX_INT8_FILE
+        return SentenceTransformer(self.model_name, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+
+    def _estimate_tokens(self, text):
+        # WordPiece splits ~1.3 tokens per word; +2 for [CLS]/[SEP]
+        return min(self.max_seq_length, int(len(text.split()) * 1.3) + 2)
+
+    def _batches(self, order, lengths):
+        batch, longest = [], 0
+        for i in order:
+            longest = max(longest, lengths[i])
+            if batch and (longest * (len(batch) + 1) > self.batch_tokens or len(batch) >= MAX_BATCH_SIZE):
+                yield batch
+                batch, longest = [], lengths[i]
+            batch.append(i)
+        if batch:
+            yield batch
+
+    def encode(self, texts):
+        """
+        Return a (len(texts), dim) float32 array in input order
+        """
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, self.model.get_sentence_embedding_dimension()), dtype='float32')
+        lengths = [self._estimate_tokens(t) for t in texts]
+        order = sorted(range(len(texts)), key=lengths.__getitem__, reverse=True)
+        out = None
+        for batch in self._batches(order, lengths):
+            vectors = self.model.encode([texts[i] for i in batch], batch_size=len(batch),
+                                        convert_to_numpy=True, show_progress_bar=False)
+            if out is None:
+                out = np.empty((len(texts), vectors.shape[1]), dtype='float32')
+            out[batch] = vectors
+        return out
@@ -0,0 +1,125 @@
+import os
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+import numpy as np
+
+from config import DATA_DIR
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache keyed by (model name, normalized text hash):
+    - an in-memory LRU of the most recent vectors
+    - a SQLite table on disk that survives restarts
+
+    Only texts missing from both tiers reach encode_fn, in a single batch.
+    With enabled set to False every call goes straight to encode_fn
+    (benchmarks use this to time the model rather than the cache).
+    """
+
+    def __init__(self, model_name, encode_fn, path=None, max_items=20000):
+        self.model_name = model_name
+        self.encode_fn = encode_fn
+        self.path = path or os.path.join(DATA_DIR, "embeddings.db")
+        self.max_items = max_items
+        self.enabled = True
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = self._connect()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL
+            )
+        ''')
+        conn.commit()
+        conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _key(self, text):
+        normalized = " ".join(text.split())
+        return hashlib.sha256(f"{self.model_name}\0{normalized}".encode('utf-8')).hexdigest()
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def encode(self, texts):
+        """
+        Return a (len(texts), dim) float32 array, computing only cache misses
+        """
+        if not self.enabled:
+            return np.asarray(self.encode_fn(list(texts)), dtype='float32')
+        keys = [self._key(t) for t in texts]
+        found = {}
+
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    found[key] = self._memory[key]
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+
+        pending = list(dict.fromkeys(k for k in keys if k not in found))
+        if pending:
+            conn = self._connect()
+            for start in range(0, len(pending), 500):
+                batch = pending[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f'SELECT key, vector FROM embeddings WHERE key IN ({placeholders})', batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype='float32')
+            conn.close()
+
+            with self._lock:
+                for key in pending:
+                    if key in found:
+                        self.disk_hits += 1
+                        self._remember(key, found[key])
+
+        # Encode each distinct missing text once, in one batch
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = np.asarray(self.encode_fn(list(missing.values())), dtype='float32')
+            conn = self._connect()
+            conn.executemany(
+                'INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)',
+                [(key, vec.tobytes()) for key, vec in zip(missing, vectors)]
+            )
+            conn.commit()
+            conn.close()
+
+            with self._lock:
+                self.misses += len(missing)
+                for key, vec in zip(missing, vectors):
+                    found[key] = vec
+                    self._remember(key, vec)
+
+        return np.vstack([found[k] for k in keys]) if keys else np.zeros((0, 0), dtype='float32')
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_items": len(self._memory),
+            "memory_bytes": sum(v.nbytes for v in list(self._memory.values())),
+        }
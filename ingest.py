@@ -0,0 +1,219 @@
+import os
+import hashlib
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from chunker import iter_chunks
+import ocr
+import pdf_extract
+
+# Streaming ingestion: pages -> chunks -> embedding batches -> index.
+# Every stage holds a bounded amount of data, so a 1,000-page textbook
+# needs no more memory than a 10-page handout.
+
+PAGES_PER_TASK = 8          # pages extracted per process-pool task
+EMBED_BATCH_SIZE = 64       # chunks per encode() call
+TEXT_BLOCK_SIZE = 1 << 20   # bytes read at a time from plain-text files
+MAX_WORKERS = int(os.getenv("MINDGAP_INGEST_WORKERS", str(os.cpu_count() or 1)))
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+# One extraction pool per process, shared by every ingest job
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _extraction_pool():
+    """
+    The shared page-extraction pool. Workers come from a fork server (or
+    are spawned where there is none) rather than forked from this
+    multi-threaded process, whose sqlite3 and model locks may be held by
+    other threads at fork time.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(max_workers=MAX_WORKERS, mp_context=multiprocessing.get_context(method))
+        return _pool
+
+
+def _reset_pool(broken):
+    # A worker that died (OOM, segfault in a PDF library) breaks the whole pool
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+
+
+def _extract_page_range(file_path, sha256, start, stop):
+    """
+    Runs in a worker process: extract text for pages [start, stop).
+    Pages in the page cache are not parsed again. Scanned pages (no text
+    layer) are OCR'd here too, so OCR runs in parallel across the pool;
+    pages whose OCR failed are not cached, so they are retried next time.
+    Returns (page_number, text, ocr_info) tuples.
+    """
+    cached = pdf_extract.cached_pages(sha256, start + 1, stop + 1)
+    if len(cached) == stop - start:
+        return [(n + 1, cached[n + 1], None) for n in range(start, stop)]
+
+    reader = pdf_extract.open_pdf(file_path)
+    try:
+        pages, extracted = [], []
+        for n in range(start, stop):
+            if n + 1 in cached:
+                pages.append((n + 1, cached[n + 1], None))
+                continue
+            text, info = ocr.ocr_scanned_page(reader.text(n), lambda: reader.images(n))
+            pages.append((n + 1, text, info))
+            if not (info and info["failed"]):
+                extracted.append((n + 1, text))
+        pdf_extract.store_pages(sha256, extracted, reader.name)
+    finally:
+        reader.close()
+    return pages
+
+
+def _collect(pages):
+    for page_number, text, info in pages:
+        ocr.record(info)
+        yield page_number, text
+
+
+def count_pages(file_path, sha256=None):
+    if file_path.endswith('.pdf'):
+        return pdf_extract.page_count(file_path, sha256 or file_sha256(file_path))
+    if file_path.lower().endswith(IMAGE_EXTENSIONS):
+        return 0
+    return max(1, -(-os.path.getsize(file_path) // TEXT_BLOCK_SIZE))
+
+
+def iter_pages(file_path, ocr_text="", workers=MAX_WORKERS, sha256=None):
+    """
+    Yield (page_number, text) in document order. sha256 (the file's hash)
+    keys the PDF page cache; it is computed if not given. PDF pages are
+    extracted on the shared pool, with at most 2 * workers tasks of this
+    document in flight; workers <= 1 extracts in this process.
+    """
+    if ocr_text:
+        yield 1, ocr_text
+
+    if file_path.endswith('.pdf'):
+        sha256 = sha256 or file_sha256(file_path)
+        total = count_pages(file_path, sha256)
+        ranges = [(s, min(s + PAGES_PER_TASK, total)) for s in range(0, total, PAGES_PER_TASK)]
+
+        if workers <= 1 or len(ranges) <= 1:
+            for start, stop in ranges:
+                yield from _collect(_extract_page_range(file_path, sha256, start, stop))
+            return
+
+        pool = _extraction_pool()
+        # Keep at most two tasks per worker in flight so extracted text
+        # never piles up ahead of the embedding stage
+        pending = deque()
+        ranges = iter(ranges)
+        try:
+            while True:
+                while len(pending) < 2 * workers:
+                    page_range = next(ranges, None)
+                    if page_range is None:
+                        break
+                    pending.append(pool.submit(_extract_page_range, file_path, sha256, *page_range))
+                if not pending:
+                    break
+                yield from _collect(pending.popleft().result())
+        except BrokenProcessPool:
+            _reset_pool(pool)
+            raise
+        finally:
+            for future in pending:
+                future.cancel()
+    elif not file_path.lower().endswith(IMAGE_EXTENSIONS):
+        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+            page_number = 1
+            carry = ""
+            while True:
+                block = f.read(TEXT_BLOCK_SIZE)
+                if not block:
+                    break
+                # Split on the last whitespace so no word is cut between blocks
+                text = carry + block
+                cut = max(text.rfind(" "), text.rfind("\n"))
+                if cut <= 0:
+                    carry = text
+                    continue
+                carry = text[cut:]
+                yield page_number, text[:cut]
+                page_number += 1
+            if carry.strip():
+                yield page_number, carry
+
+
+def file_sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(TEXT_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def document_key(file_name):
+    """
+    Stable id for a document across versions, used for metadata filters
+    """
+    return hashlib.sha1(file_name.encode('utf-8')).hexdigest()[:16]
+
+
+def chunk_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def run_pipeline(file_path, ocr_text, index_fn, progress=None,
+                 batch_size=EMBED_BATCH_SIZE, skip_chunks=0):
+    """
+    Stream a file through extraction, chunking and batched indexing.
+    index_fn(chunks) embeds and inserts one batch of chunk dicts
+    ({"text", "page_start", "page_end", "offset_start", "offset_end",
+    "ordinal"}, see chunker.iter_chunks); each batch is
+    searchable as soon as it returns.
+    progress(pages_done, total_pages, chunks_done) is called after every batch.
+    skip_chunks resumes an interrupted run: chunking is deterministic, so the
+    first skip_chunks chunks are re-derived but not embedded again.
+    Returns the number of chunks indexed (including skipped ones).
+    """
+    sha256 = file_sha256(file_path) if file_path.endswith('.pdf') else None
+    total_pages = (1 if ocr_text else 0) + count_pages(file_path, sha256)
+    state = {"pages": 0}
+
+    def counted(pages):
+        for page in pages:
+            state["pages"] += 1
+            yield page
+
+    chunks_done = skip_chunks
+    batch = []
+
+    def flush():
+        nonlocal chunks_done, batch
+        index_fn(batch)
+        chunks_done += len(batch)
+        batch = []
+        if progress:
+            progress(min(state["pages"], total_pages), total_pages, chunks_done)
+
+    for ordinal, chunk in enumerate(iter_chunks(counted(iter_pages(file_path, ocr_text, sha256=sha256)))):
+        if ordinal < skip_chunks:
+            continue
+        chunk["ordinal"] = ordinal
+        batch.append(chunk)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    if progress:
+        progress(total_pages, total_pages, chunks_done)
+    return chunks_done
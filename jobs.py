@@ -0,0 +1,71 @@
+import threading
+import traceback
+from database import claim_ingest_job, create_ingest_job, update_ingest_job, get_ingest_jobs
+from ocr import ocr_file
+
+POLL_SECONDS = 5
+
+
+class IngestJobRunner:
+    """
+    Worker pool that indexes uploads outside the Streamlit script run.
+
+    Job state lives in the ingest_jobs table of mindgap.db, so the UI of
+    any session can poll it and a job interrupted by a crash is picked up
+    again (from its last checkpointed chunk) once its heartbeat goes stale.
+    """
+
+    def __init__(self, rag, workers=2):
+        self.rag = rag
+        self._wake = threading.Event()
+        self._threads = [
+            threading.Thread(target=self._worker_loop, name=f"ingest-worker-{n}", daemon=True)
+            for n in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, file_name, path, file_type):
+        job_id = create_ingest_job(file_name, path, file_type)
+        self._wake.set()
+        return job_id
+
+    def jobs(self, limit=20):
+        return get_ingest_jobs(limit)
+
+    def _worker_loop(self):
+        while True:
+            try:
+                job = claim_ingest_job()
+            except Exception as e:
+                print(f"Ingest job claim failed: {e}")
+                job = None
+            if job is None:
+                self._wake.wait(POLL_SECONDS)
+                self._wake.clear()
+                continue
+            self._run(job)
+
+    def _run(self, job):
+        job_id = job["id"]
+        try:
+            ocr_text = ""
+            if (job["file_type"] or "").startswith("image/"):
+                try:
+                    ocr_text = ocr_file(job["path"])
+                except Exception as e:
+                    print(f"OCR failed for {job['file_name']}: {e}")
+
+            def checkpoint(pages_done, total_pages, chunks_done):
+                update_ingest_job(job_id, pages_done=pages_done, total_pages=total_pages,
+                                  chunks_done=chunks_done)
+
+            result = self.rag.index_document(
+                job["file_name"], job["path"], ocr_text,
+                progress=checkpoint, skip_chunks=job["chunks_done"] or 0
+            )
+            status = "done" if result["status"] == "indexed" else "skipped"
+            update_ingest_job(job_id, status=status, chunks_done=result["chunks"])
+        except Exception as e:
+            traceback.print_exc()
+            update_ingest_job(job_id, status="failed", error=str(e))
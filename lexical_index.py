@@ -0,0 +1,116 @@
+import os
+import re
+import sqlite3
+
+from config import DATA_DIR
+
+RRF_K = 60
+# Left out of queries: every chunk matches them, so they would pull
+# unrelated chunks into an otherwise off-topic question's results
+STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from had has have how i if in into is it its
+me my of on or so than that the their them then there these they this to was we were what
+when where which who why will with you your
+""".split())
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index over chunk texts, backed by SQLite FTS5.
+
+    Chunks are keyed by their vector id (local chunk id or Pinecone id), so
+    lexical and dense results can be fused. The FTS table uses external
+    content with triggers, so inserts and deletes update the index
+    incrementally in the same transaction.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(DATA_DIR, "lexical.db")
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = self._connect()
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS chunk_text (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT UNIQUE NOT NULL,
+                doc_id TEXT,
+                text TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_chunk_text_doc_id ON chunk_text (doc_id);
+
+            -- underscores are token characters so code identifiers stay whole
+            CREATE VIRTUAL TABLE IF NOT EXISTS chunk_fts USING fts5(
+                text, content='chunk_text', content_rowid='id',
+                tokenize="porter unicode61 tokenchars '_'"
+            );
+
+            CREATE TRIGGER IF NOT EXISTS chunk_text_ai AFTER INSERT ON chunk_text BEGIN
+                INSERT INTO chunk_fts (rowid, text) VALUES (new.id, new.text);
+            END;
+            CREATE TRIGGER IF NOT EXISTS chunk_text_ad AFTER DELETE ON chunk_text BEGIN
+                INSERT INTO chunk_fts (chunk_fts, rowid, text) VALUES ('delete', old.id, old.text);
+            END;
+        ''')
+        conn.commit()
+        conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def add(self, keys, texts, doc_ids=None):
+        doc_ids = doc_ids or [None] * len(keys)
+        conn = self._connect()
+        conn.executemany(
+            'INSERT OR IGNORE INTO chunk_text (key, doc_id, text) VALUES (?, ?, ?)',
+            [(str(k), d, t) for k, t, d in zip(keys, texts, doc_ids)]
+        )
+        conn.commit()
+        conn.close()
+
+    def remove(self, keys):
+        conn = self._connect()
+        conn.executemany('DELETE FROM chunk_text WHERE key = ?', [(str(k),) for k in keys])
+        conn.commit()
+        conn.close()
+
+    def count(self):
+        conn = self._connect()
+        n = conn.execute('SELECT COUNT(*) FROM chunk_text').fetchone()[0]
+        conn.close()
+        return n
+
+    def search(self, query, top_k=20, doc_id=None):
+        """
+        Return [(key, bm25_score)] best first (FTS5 bm25 is lower-is-better).
+        Stopwords are ignored, so a query of only common words matches nothing.
+        """
+        terms = [t for t in re.findall(r"\w+", query.lower()) if t not in STOPWORDS]
+        if not terms:
+            return []
+        match = " OR ".join(f'"{t}"' for t in dict.fromkeys(terms))
+        sql = '''
+            SELECT chunk_text.key, bm25(chunk_fts)
+            FROM chunk_fts JOIN chunk_text ON chunk_text.id = chunk_fts.rowid
+            WHERE chunk_fts MATCH ?
+        '''
+        params = [match]
+        if doc_id:
+            sql += ' AND chunk_text.doc_id = ?'
+            params.append(doc_id)
+        sql += ' ORDER BY bm25(chunk_fts) LIMIT ?'
+        params.append(top_k)
+
+        conn = self._connect()
+        rows = conn.execute(sql, params).fetchall()
+        conn.close()
+        return [(key, score) for key, score in rows]
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """
+    Fuse ranked key lists: score(key) = sum over lists of 1 / (k + rank)
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
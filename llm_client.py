@@ -0,0 +1,233 @@
+import re
+import time
+import random
+import asyncio
+import heapq
+import itertools
+import threading
+
+INTERACTIVE = 0   # a user is waiting on the answer
+BACKGROUND = 1    # summaries, warm-ups and other work nobody is watching
+
+MAX_CONCURRENCY = 8
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 20.0
+DEFAULT_DEADLINE = 60.0
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def _parse_duration(value):
+    """
+    Parse Groq/OpenAI reset headers such as "1.5s", "250ms" or "2m59.56s"
+    """
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    seconds = 0.0
+    for amount, unit in re.findall(r'([\d.]+)(ms|h|m|s)', value):
+        seconds += float(amount) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    return seconds
+
+
+class PriorityLimiter:
+    """
+    Concurrency limiter that hands free slots to the highest-priority
+    (lowest number), oldest waiter first
+    """
+
+    def __init__(self, slots):
+        self._free = slots
+        self._waiters = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+
+    def acquire(self, priority, deadline):
+        with self._cond:
+            ticket = (priority, next(self._counter))
+            heapq.heappush(self._waiters, ticket)
+            try:
+                while not (self._free > 0 and self._waiters[0] == ticket):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise DeadlineExceeded("Timed out waiting for an LLM slot")
+                    self._cond.wait(remaining)
+            finally:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+            self._free -= 1
+
+    def release(self):
+        with self._cond:
+            self._free += 1
+            self._cond.notify_all()
+
+
+class RateLimitBucket:
+    """
+    Request and token budgets learned from x-ratelimit-* response headers.
+    Unknown budgets (before the first response) never block.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests_remaining = None
+        self.requests_reset_at = 0.0
+        self.tokens_remaining = None
+        self.tokens_reset_at = 0.0
+        self.blocked_until = 0.0
+
+    def wait_time(self, estimated_tokens):
+        now = time.monotonic()
+        with self._lock:
+            wait = max(0.0, self.blocked_until - now)
+            if self.requests_remaining is not None and self.requests_remaining <= 0:
+                wait = max(wait, self.requests_reset_at - now)
+            if self.tokens_remaining is not None and self.tokens_remaining < estimated_tokens:
+                wait = max(wait, self.tokens_reset_at - now)
+            return wait
+
+    def consume(self, estimated_tokens):
+        with self._lock:
+            if self.requests_remaining is not None:
+                self.requests_remaining -= 1
+            if self.tokens_remaining is not None:
+                self.tokens_remaining -= estimated_tokens
+
+    def update(self, headers):
+        if headers is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if headers.get("x-ratelimit-remaining-requests") is not None:
+                self.requests_remaining = int(float(headers["x-ratelimit-remaining-requests"]))
+                self.requests_reset_at = now + (_parse_duration(headers.get("x-ratelimit-reset-requests")) or 0)
+            if headers.get("x-ratelimit-remaining-tokens") is not None:
+                self.tokens_remaining = int(float(headers["x-ratelimit-remaining-tokens"]))
+                self.tokens_reset_at = now + (_parse_duration(headers.get("x-ratelimit-reset-tokens")) or 0)
+            retry_after = _parse_duration(headers.get("retry-after"))
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+
+
+class LLMClient:
+    """
+    Shared Groq client: pooled HTTP connections, a priority-aware
+    concurrency limit, header-driven rate-limit scheduling, jittered
+    exponential backoff on 429/5xx/network errors and a deadline per request.
+    """
+
+    def __init__(self, api_key, base_url, max_concurrency=MAX_CONCURRENCY, max_retries=MAX_RETRIES):
+        import httpx
+        from openai import OpenAI
+        self._client = OpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            max_retries=0,  # retries are scheduled here, with rate-limit awareness
+            http_client=httpx.Client(
+                limits=httpx.Limits(max_connections=max_concurrency * 2,
+                                    max_keepalive_connections=max_concurrency),
+            ),
+        )
+        self.max_retries = max_retries
+        self._limiter = PriorityLimiter(max_concurrency)
+        self._bucket = RateLimitBucket()
+        self._stats_lock = threading.Lock()
+        self.stats = {"requests": 0, "retries": 0, "rate_limited": 0, "failures": 0}
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def _estimate_tokens(self, messages, max_tokens):
+        # ~4 characters per token is close enough for scheduling
+        return sum(len(m.get("content", "")) for m in messages) // 4 + (max_tokens or 512)
+
+    def _is_retryable(self, error):
+        from openai import APIConnectionError, APITimeoutError, RateLimitError, InternalServerError
+        return isinstance(error, (APIConnectionError, APITimeoutError, RateLimitError, InternalServerError))
+
+    def _backoff(self, attempt, deadline):
+        delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+        if time.monotonic() + delay >= deadline:
+            raise DeadlineExceeded("LLM request deadline exceeded while retrying")
+        time.sleep(delay)
+
+    def _send(self, messages, priority, deadline, stream, **kwargs):
+        """
+        Run one request through the limiter, bucket and retry loop.
+        Returns (response, release) - release() must be called once the
+        response (or stream) is fully consumed.
+        """
+        deadline = time.monotonic() + (deadline or DEFAULT_DEADLINE)
+        estimated = self._estimate_tokens(messages, kwargs.get("max_tokens"))
+        self._count("requests")
+
+        for attempt in range(self.max_retries + 1):
+            self._limiter.acquire(priority, deadline)
+            released = False
+
+            def release():
+                nonlocal released
+                if not released:
+                    released = True
+                    self._limiter.release()
+
+            try:
+                wait = self._bucket.wait_time(estimated)
+                if wait > 0:
+                    self._count("rate_limited")
+                    if time.monotonic() + wait >= deadline:
+                        raise DeadlineExceeded("Rate limit resets after the request deadline")
+                    time.sleep(wait)
+                self._bucket.consume(estimated)
+
+                raw = self._client.chat.completions.with_raw_response.create(
+                    messages=messages, stream=stream,
+                    timeout=max(1.0, deadline - time.monotonic()), **kwargs
+                )
+                self._bucket.update(raw.headers)
+                return raw.parse(), release
+            except Exception as e:
+                release()
+                response = getattr(e, "response", None)
+                self._bucket.update(getattr(response, "headers", None))
+                if not self._is_retryable(e) or attempt == self.max_retries:
+                    self._count("failures")
+                    raise
+                self._count("retries")
+                self._backoff(attempt, deadline)
+
+    def chat(self, messages, priority=INTERACTIVE, deadline=None, **kwargs):
+        """
+        Blocking chat completion; returns the message content
+        """
+        resp, release = self._send(messages, priority, deadline, stream=False, **kwargs)
+        release()
+        return resp.choices[0].message.content
+
+    def stream_chat(self, messages, priority=INTERACTIVE, deadline=None, **kwargs):
+        """
+        Yield content deltas of a streamed chat completion. Retries happen
+        only before the stream starts; the slot is held until it ends.
+        """
+        stream, release = self._send(messages, priority, deadline, stream=True, **kwargs)
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            release()
+
+    async def achat(self, messages, priority=INTERACTIVE, deadline=None, **kwargs):
+        """
+        Async wrapper around chat() for asyncio callers
+        """
+        return await asyncio.to_thread(self.chat, messages, priority, deadline, **kwargs)
@@ -0,0 +1,186 @@
+import os
+import io
+import time
+import hashlib
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from config import DATA_DIR
+
+OCR_LANG = os.getenv("MINDGAP_OCR_LANG", "eng")
+OCR_WORKERS = int(os.getenv("MINDGAP_OCR_WORKERS", str(os.cpu_count() or 1)))
+OCR_MAX_SIDE = 2400           # px; roughly an A4 page at 300 dpi, larger scans are downscaled
+DESKEW_MAX_ANGLE = 5.0        # degrees searched either way
+DESKEW_STEP = 0.5
+SCANNED_PAGE_MIN_CHARS = 25   # PDF pages with less text than this are OCR'd from their images
+
+# OCR counters for this process; worker results are recorded by the caller
+_stats_lock = threading.Lock()
+_stats = {"pages": 0, "cache_hits": 0, "seconds": 0.0, "failures": 0}
+
+
+def _connect():
+    os.makedirs(DATA_DIR, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(DATA_DIR, "ocr.db"), timeout=30)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ocr_cache (
+            key TEXT PRIMARY KEY,
+            text TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    return conn
+
+
+def _cache_key(data):
+    # Preprocessing settings are part of the key, so changing them re-runs OCR
+    settings = f"{OCR_LANG}\0{OCR_MAX_SIDE}\0{DESKEW_MAX_ANGLE}\0".encode('utf-8')
+    return hashlib.sha256(settings + data).hexdigest()
+
+
+def _cache_get(key):
+    conn = _connect()
+    row = conn.execute('SELECT text FROM ocr_cache WHERE key = ?', (key,)).fetchone()
+    conn.close()
+    return row[0] if row else None
+
+
+def _cache_put(key, text):
+    conn = _connect()
+    conn.execute('INSERT OR REPLACE INTO ocr_cache (key, text) VALUES (?, ?)', (key, text))
+    conn.commit()
+    conn.close()
+
+
+def _deskew_angle(gray):
+    """
+    Skew angle that makes text rows most distinct: the rotation whose
+    horizontal ink profile has the sharpest row-to-row changes
+    """
+    from PIL import Image
+    thumb = gray.copy()
+    thumb.thumbnail((800, 800))
+    ink = Image.fromarray(((np.asarray(thumb) < 128) * 255).astype('uint8'))
+    if np.asarray(ink).mean() < 0.5:
+        return 0.0
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-DESKEW_MAX_ANGLE, DESKEW_MAX_ANGLE + 1e-6, DESKEW_STEP):
+        profile = np.asarray(ink.rotate(float(angle), fillcolor=0), dtype='float32').sum(axis=1)
+        score = float(np.square(np.diff(profile)).sum())
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+
+def preprocess(image):
+    """
+    Grayscale, downscale to OCR_MAX_SIDE and deskew an image for Tesseract
+    """
+    from PIL import Image, ImageOps
+    gray = ImageOps.exif_transpose(image).convert("L")
+    if max(gray.size) > OCR_MAX_SIDE:
+        gray.thumbnail((OCR_MAX_SIDE, OCR_MAX_SIDE), Image.LANCZOS)
+    angle = _deskew_angle(gray)
+    if angle:
+        gray = gray.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+    return gray
+
+
+def ocr_image_bytes(data, use_cache=True):
+    """
+    OCR one encoded image. Returns (text, info) where info has "cached"
+    and "seconds" for record().
+    """
+    key = _cache_key(data)
+    if use_cache:
+        cached = _cache_get(key)
+        if cached is not None:
+            return cached, {"cached": True, "seconds": 0.0}
+    import pytesseract
+    from PIL import Image
+    start = time.perf_counter()
+    text = pytesseract.image_to_string(preprocess(Image.open(io.BytesIO(data))), lang=OCR_LANG)
+    _cache_put(key, text)
+    return text, {"cached": False, "seconds": time.perf_counter() - start}
+
+
+def ocr_scanned_page(text, get_images):
+    """
+    OCR a PDF page whose text layer is (nearly) empty. get_images()
+    returns the page as encoded images (a rendering, or its embedded
+    images). Returns (text, info); info is None if nothing was OCR'd.
+    An image that can't be OCR'd (no Tesseract, an image format PIL can't
+    read) is skipped and info["failed"] is set; if none can be, the text
+    layer is returned.
+    """
+    if len(text.strip()) >= SCANNED_PAGE_MIN_CHARS:
+        return text, None
+    info = {"cached": True, "seconds": 0.0, "failed": False}
+    try:
+        images = get_images()
+    except Exception as e:
+        print(f"Could not get page images for OCR: {e}")
+        return text, {**info, "cached": False, "failed": True}
+    if not images:
+        return text, None
+    texts = []
+    for data in images:
+        try:
+            image_text, image_info = ocr_image_bytes(data)
+        except Exception as e:
+            print(f"OCR failed, using the page's text layer: {e}")
+            info["failed"] = True
+            continue
+        texts.append(image_text)
+        info["cached"] = info["cached"] and image_info["cached"]
+        info["seconds"] += image_info["seconds"]
+    if not texts:
+        info["cached"] = False
+    return "\n".join(t.strip() for t in texts if t.strip()) or text, info
+
+
+def record(info):
+    """
+    Add one OCR'd page to this process's counters
+    """
+    if not info:
+        return
+    with _stats_lock:
+        _stats["failures"] += info.get("failed", False)
+        _stats["pages"] += 1
+        _stats["cache_hits"] += info["cached"]
+        _stats["seconds"] += info["seconds"]
+
+
+def ocr_images(images, workers=OCR_WORKERS, use_cache=True):
+    """
+    OCR a list of encoded images across a process pool; returns their texts in order
+    """
+    if workers <= 1 or len(images) <= 1:
+        results = [ocr_image_bytes(data, use_cache) for data in images]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(images))) as pool:
+            results = list(pool.map(ocr_image_bytes, images, [use_cache] * len(images)))
+    for _, info in results:
+        record(info)
+    return [text for text, _ in results]
+
+
+def ocr_file(path):
+    with open(path, 'rb') as f:
+        return ocr_images([f.read()], workers=1)[0]
+
+
+def ocr_stats():
+    """
+    Pages OCR'd in this process, cache hits, pages with OCR failures, and
+    pages per second of OCR time (per worker: parallel pages overlap in
+    wall-clock time)
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    ocr_pages = stats["pages"] - stats["cache_hits"] - stats["failures"]
+    stats["pages_per_second"] = ocr_pages / stats["seconds"] if stats["seconds"] else None
+    return stats
@@ -0,0 +1,194 @@
+import os
+import io
+import sqlite3
+
+from config import DATA_DIR
+
+# "auto" uses the first installed backend in BACKENDS (fastest first)
+PDF_BACKEND = os.getenv("MINDGAP_PDF_BACKEND", "auto")
+BACKENDS = ["pymupdf", "pypdfium2", "pypdf", "PyPDF2"]
+RENDER_DPI = 300   # scanned pages are rendered at this resolution for OCR
+
+
+class PyMuPDFReader:
+    name = "pymupdf"
+
+    def __init__(self, path):
+        import fitz
+        self._fitz = fitz
+        self._doc = fitz.open(path)
+
+    def __len__(self):
+        return self._doc.page_count
+
+    def text(self, n):
+        return self._doc[n].get_text()
+
+    def images(self, n):
+        pixmap = self._doc[n].get_pixmap(dpi=RENDER_DPI, colorspace=self._fitz.csGRAY)
+        return [pixmap.tobytes("png")]
+
+    def close(self):
+        self._doc.close()
+
+
+class PdfiumReader:
+    name = "pypdfium2"
+
+    def __init__(self, path):
+        import pypdfium2
+        self._pdf = pypdfium2.PdfDocument(path)
+
+    def __len__(self):
+        return len(self._pdf)
+
+    def text(self, n):
+        page = self._pdf[n]
+        textpage = page.get_textpage()
+        try:
+            return textpage.get_text_range()
+        finally:
+            textpage.close()
+            page.close()
+
+    def images(self, n):
+        page = self._pdf[n]
+        try:
+            image = page.render(scale=RENDER_DPI / 72, grayscale=True).to_pil()
+        finally:
+            page.close()
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+        return [buffer.getvalue()]
+
+    def close(self):
+        self._pdf.close()
+
+
+class PypdfReader:
+    """
+    pypdf and its predecessor PyPDF2 share an API; scanned pages are OCR'd
+    from their embedded images since neither can render
+    """
+
+    def __init__(self, path, module="pypdf"):
+        self.name = module
+        reader_module = __import__(module)
+        self._file = open(path, 'rb')
+        self._reader = reader_module.PdfReader(self._file)
+
+    def __len__(self):
+        return len(self._reader.pages)
+
+    def text(self, n):
+        return self._reader.pages[n].extract_text() or ""
+
+    def images(self, n):
+        try:
+            return [image.data for image in self._reader.pages[n].images]
+        except Exception:
+            # Old releases have no page.images, or the image filter is unsupported
+            return []
+
+    def close(self):
+        self._file.close()
+
+
+def available_backends():
+    found = []
+    for name, module in (("pymupdf", "fitz"), ("pypdfium2", "pypdfium2"), ("pypdf", "pypdf"), ("PyPDF2", "PyPDF2")):
+        try:
+            __import__(module)
+            found.append(name)
+        except ImportError:
+            pass
+    return found
+
+
+def open_pdf(path, backend=PDF_BACKEND):
+    """
+    Open a PDF with the given backend, or the fastest installed one for "auto"
+    """
+    if backend == "auto":
+        installed = available_backends()
+        if not installed:
+            raise RuntimeError("No PDF backend installed; install pymupdf, pypdfium2 or pypdf")
+        backend = installed[0]
+    if backend == "pymupdf":
+        return PyMuPDFReader(path)
+    if backend == "pypdfium2":
+        return PdfiumReader(path)
+    if backend in ("pypdf", "PyPDF2"):
+        return PypdfReader(path, backend)
+    raise ValueError(f"Unknown PDF backend {backend!r}; expected auto or one of {BACKENDS}")
+
+
+# ── Page cache ──────────────────────────────────
+# Extracted (and OCR'd) page text keyed by file hash and page number, so
+# re-chunking or re-embedding a document never parses the PDF again.
+
+def _connect():
+    os.makedirs(DATA_DIR, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(DATA_DIR, "pages.db"), timeout=30)
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS pdf_files (
+            sha256 TEXT PRIMARY KEY,
+            pages INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS pdf_pages (
+            sha256 TEXT NOT NULL,
+            page INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            backend TEXT,
+            PRIMARY KEY (sha256, page)
+        );
+    ''')
+    return conn
+
+
+def page_count(path, sha256):
+    conn = _connect()
+    row = conn.execute('SELECT pages FROM pdf_files WHERE sha256 = ?', (sha256,)).fetchone()
+    if row is None:
+        reader = open_pdf(path)
+        try:
+            row = (len(reader),)
+        finally:
+            reader.close()
+        conn.execute('INSERT OR REPLACE INTO pdf_files (sha256, pages) VALUES (?, ?)', (sha256, row[0]))
+        conn.commit()
+    conn.close()
+    return row[0]
+
+
+def cached_pages(sha256, start, stop):
+    """
+    {page_number: text} for cached pages in [start, stop) (1-based)
+    """
+    conn = _connect()
+    rows = conn.execute(
+        'SELECT page, text FROM pdf_pages WHERE sha256 = ? AND page >= ? AND page < ?', (sha256, start, stop)
+    ).fetchall()
+    conn.close()
+    return dict(rows)
+
+
+def store_pages(sha256, pages, backend):
+    """
+    Cache (page_number, text) pairs
+    """
+    conn = _connect()
+    conn.executemany(
+        'INSERT OR REPLACE INTO pdf_pages (sha256, page, text, backend) VALUES (?, ?, ?, ?)',
+        [(sha256, n, text, backend) for n, text in pages]
+    )
+    conn.commit()
+    conn.close()
+
+
+def forget(sha256):
+    conn = _connect()
+    conn.execute('DELETE FROM pdf_pages WHERE sha256 = ?', (sha256,))
+    conn.execute('DELETE FROM pdf_files WHERE sha256 = ?', (sha256,))
+    conn.commit()
+    conn.close()
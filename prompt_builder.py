@@ -0,0 +1,158 @@
+import os
+import re
+
+# Token budget for the user prompt sent to generate_response. The reply
+# (max_tokens=1200) and the system message come on top of this.
+PROMPT_TOKEN_BUDGET = int(os.getenv("MINDGAP_PROMPT_TOKENS", "2500"))
+CONTEXT_SHARE = 0.7         # share of the free budget given to retrieved context
+RECENT_TURNS = 2            # turns kept verbatim; older ones are summarized
+SUMMARIZED_TURNS = 20       # how far back older turns are summarized
+MAX_TURN_TOKENS = 300       # cap per verbatim AI reply
+DUPLICATE_JACCARD = 0.6     # chunks overlapping more than this with a kept one are dropped
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _encoding = None
+
+
+def count_tokens(text):
+    """
+    Token count via tiktoken when installed, else a word/punctuation
+    estimate (close to BPE counts for English prose)
+    """
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return len(_TOKEN_RE.findall(text))
+
+
+def trim_to_tokens(text, max_tokens):
+    """
+    Cut text to roughly max_tokens, preferring a sentence boundary
+    """
+    if count_tokens(text) <= max_tokens:
+        return text
+    words = text.split()
+    # Words are ~1.3 tokens on average; shrink until it fits
+    cut = int(max_tokens / 1.3)
+    while cut > 0 and count_tokens(" ".join(words[:cut])) > max_tokens:
+        cut = int(cut * 0.9)
+    trimmed = " ".join(words[:cut])
+    sentence_end = max(trimmed.rfind(". "), trimmed.rfind("? "), trimmed.rfind("! "))
+    if sentence_end > len(trimmed) // 2:
+        trimmed = trimmed[:sentence_end + 1]
+    return trimmed + " …"
+
+
+def _shingles(text, n=5):
+    words = text.lower().split()
+    return {" ".join(words[i:i + n]) for i in range(max(1, len(words) - n + 1))}
+
+
+def select_context(chunks, budget):
+    """
+    Pick chunks in order within budget tokens. Chunks are strings or
+    search hits (dicts with "text"), already ranked best first.
+    Near-duplicates, e.g. overlapping windows of the same page, are dropped
+    and the last chunk that doesn't fit whole is trimmed.
+    """
+    items = [c if isinstance(c, dict) else {"text": c} for c in chunks]
+
+    selected, seen, used, dropped = [], [], 0, 0
+    for chunk in items:
+        text = chunk["text"].strip()
+        shingles = _shingles(text)
+        if not text or any(len(shingles & s) / len(shingles | s) > DUPLICATE_JACCARD for s in seen):
+            dropped += 1
+            continue
+        tokens = count_tokens(text)
+        if used + tokens > budget:
+            remaining = budget - used
+            if remaining >= 60:
+                text = trim_to_tokens(text, remaining)
+                tokens = count_tokens(text)
+            else:
+                dropped += 1
+                continue
+        selected.append(text)
+        seen.append(shingles)
+        used += tokens
+    return selected, used, dropped
+
+
+def summarize_turns(turns, max_tokens):
+    """
+    Compact extractive summary of older turns: each question with the
+    first sentence of its answer, newest kept first when over budget
+    """
+    lines = []
+    for turn in turns:
+        answer = re.split(r"(?<=[.!?])\s", turn.get('ai', '').strip(), maxsplit=1)[0]
+        lines.append(f"- Student asked: {trim_to_tokens(turn.get('user', ''), 40)} → {trim_to_tokens(answer, 40)}")
+    while lines and count_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+def build_prompt(prompt, context, profile, history, budget=PROMPT_TOKEN_BUDGET):
+    """
+    Assemble the generate_response prompt within a token budget.
+    history is a list of {"user", "ai"} turns or a ConversationMemory.
+    Returns (prompt_text, stats) where stats has the token counts.
+    """
+    chunks = context if isinstance(context, list) else ([context] if context else [])
+
+    def render(context_text, history_text):
+        return f"""Context from materials:\n{context_text}
+
+Student profile:
+Difficulty: {profile.get('difficulty', 'beginner')}
+Language preference: {profile.get('language', 'English')}
+Weak topics: {', '.join(profile.get('weak_topics', []))}
+
+Recent conversation:
+{history_text}
+
+User message: {prompt}
+
+Respond naturally, helpfully and educationally. Keep explanations clear and adapt to the student's level.
+"""
+
+    fixed_tokens = count_tokens(render("", ""))
+    free = max(0, budget - fixed_tokens)
+
+    if hasattr(history, "recent_turns"):
+        # ConversationMemory: its rolling summary stands in for older turns
+        recent, older = history.recent_turns(), []
+        memory_summary = history.summary_text()
+    else:
+        recent = history[-RECENT_TURNS:] if RECENT_TURNS else []
+        older = (history[:-RECENT_TURNS] if RECENT_TURNS else history)[-SUMMARIZED_TURNS:]
+        memory_summary = ""
+    recent_text = "\n".join(
+        f"User: {h.get('user','')}\nAI: {trim_to_tokens(h.get('ai',''), MAX_TURN_TOKENS)}" for h in recent
+    )
+    history_budget = free - int(free * CONTEXT_SHARE) if chunks else free
+    recent_text = trim_to_tokens(recent_text, history_budget) if recent_text else ""
+    summary_budget = history_budget - count_tokens(recent_text)
+    if memory_summary:
+        summary = trim_to_tokens(memory_summary, summary_budget) if summary_budget > 20 else ""
+    else:
+        summary = summarize_turns(older, summary_budget) if older and summary_budget > 20 else ""
+    history_text = (f"Earlier in this conversation:\n{summary}\n" if summary else "") + recent_text
+    history_tokens = count_tokens(history_text)
+
+    selected, context_tokens, dropped = select_context(chunks, free - history_tokens)
+    full_prompt = render("\n\n".join(selected), history_text)
+    return full_prompt, {
+        "prompt_tokens": count_tokens(full_prompt),
+        "context_tokens": context_tokens,
+        "history_tokens": history_tokens,
+        "chunks_used": len(selected),
+        "chunks_dropped": dropped,
+    }
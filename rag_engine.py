@@ -1,137 +1,374 @@
 import os
-import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from PyPDF2 import PdfReader
-from openai import OpenAI
-from dotenv import load_dotenv
 import json
+import time
+import hashlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import resources
+from llm_client import INTERACTIVE, BACKGROUND
+from prompt_builder import build_prompt
+from lexical_index import reciprocal_rank_fusion
+from reranker import RERANK_ENABLED, RERANK_CANDIDATES
+import pdf_extract
+from ingest import run_pipeline, file_sha256, chunk_hash, document_key
+from database import (get_document, find_document_by_hash, upsert_document, get_reusable_chunks,
+                      add_document_chunks, finalize_document, delete_document, add_document_alias,
+                      get_document_aliases, delete_document_alias)
 
-# Optional Pinecone
-try:
-    from pinecone import Pinecone
-    PINECONE_AVAILABLE = True
-except ImportError:
-    PINECONE_AVAILABLE = False
-
-load_dotenv()
-
-embed_model = SentenceTransformer('all-MiniLM-L6-v2')
-client = OpenAI(
-    api_key=os.getenv("GROQ_API_KEY"),
-    base_url="https://api.groq.com/openai/v1",
-)
-
-# Decide vector store
-use_pinecone = PINECONE_AVAILABLE and bool(os.getenv("PINECONE_API_KEY"))
-
-if use_pinecone:
-    pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-    index_name = "mindgap-index"
-    existing_indexes = [index.name for index in pc.list_indexes()]
-    if index_name not in existing_indexes:
-        pc.create_index(
-            name=index_name,
-            dimension=384,
-            metric='cosine',
-            spec={'serverless': {'cloud': 'aws', 'region': 'us-east-1'}}
-        )
-    vector_index = pc.Index(index_name)
-else:
-    # FAISS fallback
-    faiss_index = faiss.IndexFlatL2(384)
-    stored_chunks = []
+# Models and vector-store clients are created lazily and shared process-wide
+# by the resources registry, so importing this module stays cheap.
+
+PINECONE_UPSERT_BATCH = 100   # vectors per upsert request (Pinecone's recommended size)
+PINECONE_CONCURRENCY = 4
+SUMMARY_MODEL = "llama-3.1-8b-instant"
+HYBRID_SEARCH = os.getenv("MINDGAP_HYBRID_SEARCH", "1") == "1"
+HYBRID_CANDIDATE_FACTOR = 4   # candidates per retriever = top_k * factor
+# Cosine similarity below which a chunk is treated as unrelated to the query
+MIN_SCORE = float(os.getenv("MINDGAP_MIN_SCORE", "0.2"))
+
+# Shared by all sessions for concurrent LLM calls (lesson + quiz, etc.)
+generation_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="mindgap-llm")
+
+# Recent responses: {"ttft": seconds to first token, "total": seconds, "deltas": n, "prompt_tokens": n}
+latency_log = deque(maxlen=500)
+
+# Recent search_many calls: {"queries": n, "seconds": wall time, "qps": queries per second}
+search_log = deque(maxlen=500)
+
+
+def latency_stats():
+    """
+    Median time-to-first-token and total latency, mean prompt size over latency_log
+    """
+    entries = list(latency_log)
+    ttfts = [e["ttft"] for e in entries if e["ttft"] is not None]
+    return {
+        "requests": len(entries),
+        "ttft_p50": float(np.median(ttfts)) if ttfts else None,
+        "total_p50": float(np.median([e["total"] for e in entries])) if entries else None,
+        "prompt_tokens_avg": float(np.mean([e["prompt_tokens"] for e in entries])) if entries else None,
+    }
 
 class RAGEngine:
     def __init__(self):
         self.dimension = 384
 
-    def process_file(self, file_path, ocr_text=""):
-        text = ocr_text
+    def index_document(self, file_name, file_path, ocr_text="", progress=None, skip_chunks=0):
+        """
+        Index a file through the content-hash manifest:
+        - identical content (same name or not) is skipped; under a new
+          name it is recorded as an alias of the indexed document
+        - a changed file only embeds chunks it didn't have before,
+          and vectors of chunks that disappeared are deleted
+        Returns {"status": "indexed" | "unchanged" | "duplicate", "chunks": n}
+        """
+        sha256 = file_sha256(file_path)
+        doc = get_document(file_name)
+        if doc and doc["sha256"] == sha256:
+            return {"status": "unchanged", "chunks": doc["chunk_count"]}
+        duplicate = find_document_by_hash(sha256)
+        if duplicate and duplicate["file_name"] != file_name:
+            if not doc:
+                add_document_alias(file_name, duplicate["id"])
+            return {"status": "duplicate", "chunks": duplicate["chunk_count"]}
 
-        if file_path.endswith('.pdf'):
-            reader = PdfReader(file_path)
-            for page in reader.pages:
-                text += (page.extract_text() or "") + "\n"
-        else:
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                text += f.read() + "\n"
+        # New content under a former alias makes it a document of its own
+        delete_document_alias(file_name)
+        doc_id = upsert_document(file_name, file_path)
+        info = self._document_info(file_name, sha256)
+        # Vectors of the previous version, by chunk hash, that can be reused as-is
+        reusable = {}
+        for h, vector_id in get_reusable_chunks(doc_id, sha256):
+            reusable.setdefault(h, []).append(vector_id)
+
+        def index_batch(chunks):
+            rows, new_chunks = [], []
+            for chunk in chunks:
+                h = chunk_hash(chunk["text"])
+                if reusable.get(h):
+                    rows.append((chunk["ordinal"], h, reusable[h].pop()))
+                else:
+                    chunk["hash"] = h
+                    new_chunks.append(chunk)
+            if new_chunks:
+                ids = self._insert_chunks(self._embed_chunks(new_chunks), new_chunks, info)
+                rows.extend((c["ordinal"], c["hash"], str(i)) for c, i in zip(new_chunks, ids))
+            add_document_chunks(doc_id, sha256, rows)
+
+        count = run_pipeline(file_path, ocr_text, index_batch, progress=progress, skip_chunks=skip_chunks)
+        stale = finalize_document(doc_id, sha256, count)
+        self._delete_vectors(stale)
+        return {"status": "indexed", "chunks": count}
 
-        chunks = self._simple_chunk(text)
+    def remove_document(self, file_name):
+        """
+        Delete a document's vectors, manifest entry and uploaded file.
+        Removing an alias only forgets the name. A document with aliases
+        can't be removed until they are, since they rely on its content.
+        """
+        if delete_document_alias(file_name):
+            return 0
+        doc = get_document(file_name)
+        if not doc:
+            return 0
+        aliases = get_document_aliases(doc["id"])
+        if aliases:
+            raise ValueError(f"{file_name} was also uploaded as {', '.join(aliases)}; remove those first")
+        vector_ids = delete_document(doc["id"])
+        self._delete_vectors(vector_ids)
+        if not find_document_by_hash(doc["sha256"]):
+            pdf_extract.forget(doc["sha256"])
+        if doc["path"] and os.path.exists(doc["path"]):
+            os.remove(doc["path"])
+        return len(vector_ids)
 
-        embeddings = embed_model.encode(chunks)
+    def _document_info(self, file_name, sha256):
+        return {"key": document_key(file_name), "sha256": sha256, "source": file_name,
+                "ingested_at": datetime.now(timezone.utc).isoformat(timespec="seconds")}
 
-        if use_pinecone:
+    def _embed_chunks(self, chunks):
+        return resources.get_embedder().encode([c["text"] for c in chunks])
+
+    def _insert_chunks(self, embeddings, chunks, doc):
+        """
+        Add chunk vectors to the active store and return their vector ids.
+        Pinecone ids are "<content hash>-<chunk ordinal>", so documents
+        never overwrite each other.
+        """
+        metadata = [
+            {"text": c["text"], "doc_id": doc["key"], "source": doc["source"],
+             "page_start": c["page_start"], "page_end": c["page_end"],
+             "offset_start": c.get("offset_start"), "offset_end": c.get("offset_end"),
+             "ingested_at": doc["ingested_at"]}
+            for c in chunks
+        ]
+        if resources.pinecone_enabled():
             vectors = [
-                {"id": str(i), "values": emb.tolist(), "metadata": {"text": chunk}}
-                for i, (emb, chunk) in enumerate(zip(embeddings, chunks))
+                {"id": f"{doc['sha256'][:16]}-{c['ordinal']}", "values": emb.tolist(), "metadata": meta}
+                for c, emb, meta in zip(chunks, embeddings, metadata)
             ]
-            vector_index.upsert(vectors=vectors)
+            index = resources.get_vector_index()
+            batches = [vectors[i:i + PINECONE_UPSERT_BATCH] for i in range(0, len(vectors), PINECONE_UPSERT_BATCH)]
+            with ThreadPoolExecutor(max_workers=PINECONE_CONCURRENCY) as pool:
+                list(pool.map(lambda batch: index.upsert(vectors=batch), batches))
+            ids = [v["id"] for v in vectors]
         else:
-            global faiss_index, stored_chunks
-            faiss_index.add(np.array(embeddings).astype('float32'))
-            stored_chunks.extend(chunks)
-
-        return len(chunks)
-
-    def _simple_chunk(self, text, size=450, overlap=80):
-        words = text.split()
-        chunks = []
-        for i in range(0, len(words), size - overlap):
-            chunk = " ".join(words[i:i + size])
-            chunks.append(chunk)
-        return chunks
-
-    def search(self, query, top_k=3):
-        query_emb = embed_model.encode([query])[0]
-
-        if use_pinecone:
-            res = vector_index.query(
-                vector=query_emb.tolist(),
-                top_k=top_k,
-                include_metadata=True
-            )
-            return [m['metadata']['text'] for m in res['matches'] if 'text' in m['metadata']]
+            ids = resources.get_local_store().add(np.array(embeddings).astype('float32'), metadata)
+        resources.get_lexical_index().add(ids, [c["text"] for c in chunks], [doc["key"]] * len(chunks))
+        return ids
+
+    def _delete_vectors(self, vector_ids):
+        if not vector_ids:
+            return
+        resources.get_lexical_index().remove(vector_ids)
+        if resources.pinecone_enabled():
+            index = resources.get_vector_index()
+            for start in range(0, len(vector_ids), 1000):
+                index.delete(ids=[str(i) for i in vector_ids[start:start + 1000]])
         else:
-            global faiss_index, stored_chunks
-            if len(stored_chunks) == 0:
-                return []
-            distances, indices = faiss_index.search(np.array([query_emb]).astype('float32'), top_k)
-            return [stored_chunks[i] for i in indices[0] if i < len(stored_chunks)]
+            resources.get_local_store().remove([int(i) for i in vector_ids])
 
-    def generate_response(self, prompt, context="", profile={}, history=[]):
-        history_text = "\n".join([f"User: {h.get('user','')}\nAI: {h.get('ai','')}" for h in history[-5:]])
-        
-        full_prompt = f"""Context from materials:\n{context}
+    def search(self, query, top_k=3, doc_id=None, hybrid=HYBRID_SEARCH, rerank=RERANK_ENABLED,
+               min_score=MIN_SCORE):
+        """
+        Return the top_k hits for a query, best first, as dicts with id,
+        text, score (cosine similarity), doc_id, source and the chunk's
+        page_start/page_end/offset_start/offset_end span. doc_id (a document_key) scopes the search to a single
+        document. With hybrid, dense and BM25 candidates are fused with
+        reciprocal-rank fusion, so exact terms (formula names, identifiers,
+        acronyms) aren't missed; hits found only by BM25 have score None.
+        With rerank, RERANK_CANDIDATES first-stage hits are reordered by a
+        cross-encoder within its latency budget. Hits that BM25 ranked are
+        always kept; the rest are dropped below min_score, so an off-topic
+        question gets no context.
+        """
+        return self.search_many([query], top_k, doc_id, hybrid, rerank, min_score)[0]
 
-Student profile:
-Difficulty: {profile.get('difficulty', 'beginner')}
-Language preference: {profile.get('language', 'English')}
-Weak topics: {', '.join(profile.get('weak_topics', []))}
+    def search_many(self, queries, top_k=3, doc_id=None, hybrid=HYBRID_SEARCH, rerank=RERANK_ENABLED,
+                    min_score=MIN_SCORE):
+        """
+        Run several searches at once and return one hit list per query (see
+        search). Queries are embedded in one batch and sent to FAISS as one
+        batched search, or to Pinecone concurrently. Throughput goes to
+        search_log.
+        """
+        if not queries:
+            return []
+        start = time.perf_counter()
+        first_stage_k = max(top_k, RERANK_CANDIDATES) if rerank else top_k
+        query_embs = resources.get_embedder().encode(list(queries))
+        candidates = max(first_stage_k * HYBRID_CANDIDATE_FACTOR, 20) if hybrid else first_stage_k
+        dense = self._dense_search(query_embs, candidates, doc_id)
 
-Recent conversation:
-{history_text}
+        if hybrid:
+            lexical_index = resources.get_lexical_index()
+            lexical = [[key for key, _ in lexical_index.search(query, candidates, doc_id)] for query in queries]
+            rankings = [reciprocal_rank_fusion([ranked, keys]) for (ranked, _), keys in zip(dense, lexical)]
+            # Lexical-only hits have no query-dependent score, so one fetch serves every query
+            missing = {
+                key for ranked, (_, hits) in zip(rankings, dense) for key in ranked[:first_stage_k] if key not in hits
+            }
+            lexical_hits = self._fetch_hits(list(missing))
+        else:
+            rankings, lexical, lexical_hits = [ranked for ranked, _ in dense], [[] for _ in queries], {}
 
-User message: {prompt}
+        results = []
+        for query, ranked, (_, hits), keys in zip(queries, rankings, dense, lexical):
+            hits, matched = {**lexical_hits, **hits}, set(keys)
+            # An exact-term match is relevant whatever its cosine score
+            query_hits = [
+                hits[key] for key in ranked
+                if key in hits and (key in matched or hits[key]["score"] >= min_score)
+            ][:first_stage_k]
+            if rerank and len(query_hits) > top_k:
+                try:
+                    query_hits = resources.get_reranker().rerank(query, query_hits, top_k)
+                except Exception as e:
+                    print(f"Reranking failed, using first-stage order: {e}")
+            results.append(query_hits[:top_k])
 
-Respond naturally, helpfully and educationally. Keep explanations clear and adapt to the student's level.
-"""
+        elapsed = time.perf_counter() - start
+        search_log.append({"queries": len(queries), "seconds": elapsed, "qps": len(queries) / max(elapsed, 1e-9)})
+        return results
+
+    def _hit(self, key, score, meta):
+        page_start, page_end = meta.get("page_start"), meta.get("page_end")
+        return {
+            "id": key, "text": meta["text"], "score": score,
+            "doc_id": meta.get("doc_id"), "source": meta.get("source"),
+            # Pinecone returns numeric metadata as floats
+            "page_start": int(page_start) if page_start is not None else None,
+            "page_end": int(page_end) if page_end is not None else None,
+            "offset_start": int(meta["offset_start"]) if meta.get("offset_start") is not None else None,
+            "offset_end": int(meta["offset_end"]) if meta.get("offset_end") is not None else None,
+        }
+
+    def _dense_search(self, query_embs, top_k, doc_id=None):
+        """
+        Vector search on the active store for a batch of query vectors.
+        Returns one (ranked vector ids as str, {id: hit}) pair per query.
+        """
+        if resources.pinecone_enabled():
+            index = resources.get_vector_index()
+
+            def query(emb):
+                res = index.query(
+                    vector=emb.tolist(),
+                    top_k=top_k,
+                    include_metadata=True,
+                    filter={"doc_id": {"$eq": doc_id}} if doc_id else None
+                )
+                matches = [m for m in res['matches'] if 'text' in m['metadata']]
+                return [m['id'] for m in matches], {m['id']: self._hit(m['id'], m['score'], m['metadata']) for m in matches}
+
+            with ThreadPoolExecutor(max_workers=PINECONE_CONCURRENCY) as pool:
+                return list(pool.map(query, query_embs))
+        else:
+            local_store = resources.get_local_store()
+            matches = local_store.search(np.asarray(query_embs, dtype='float32'), top_k, doc_id=doc_id)
+            chunks = local_store.get_chunks({chunk_id for row in matches for chunk_id, _ in row})
+            return [
+                ([str(chunk_id) for chunk_id, _ in row if chunk_id in chunks],
+                 {str(chunk_id): self._hit(str(chunk_id), score, chunks[chunk_id])
+                  for chunk_id, score in row if chunk_id in chunks})
+                for row in matches
+            ]
+
+    def _fetch_hits(self, keys):
+        """
+        Hits (without a dense score) for ids found only by the lexical index
+        """
+        if not keys:
+            return {}
+        if resources.pinecone_enabled():
+            res = resources.get_vector_index().fetch(ids=keys)
+            return {
+                key: self._hit(key, None, vector['metadata'])
+                for key, vector in res['vectors'].items() if 'text' in (vector['metadata'] or {})
+            }
+        chunks = resources.get_local_store().get_chunks([int(k) for k in keys])
+        return {str(chunk_id): self._hit(str(chunk_id), None, meta) for chunk_id, meta in chunks.items()}
+
+    def _context_text(self, context):
+        if isinstance(context, list):
+            return "\n".join(c["text"] if isinstance(c, dict) else c for c in context)
+        return context
+
+    def _cache_args(self, topic, context, profile):
+        # Search hits are keyed by their chunk ids, so unchanged retrievals share a key
+        if isinstance(context, list) and all(isinstance(c, dict) and "id" in c for c in context):
+            context_key = ",".join(sorted(str(c["id"]) for c in context))
+        else:
+            context_key = self._context_text(context)
+        return (topic, profile.get('difficulty', 'beginner'), profile.get('language', 'English'),
+                hashlib.sha1(context_key.encode('utf-8')).hexdigest())
+
+    def stream_response(self, prompt, context="", profile={}, history=[], use_cache=False):
+        """
+        Yield the answer as text deltas while the LLM generates it.
+        context is the retrieved text or a list of chunks; the prompt is
+        fitted to a token budget by prompt_builder.build_prompt.
+        Time-to-first-token, total latency and prompt tokens go to latency_log.
+        With use_cache, a lesson for a near-identical topic, level, language
+        and context is served from the response cache (history is ignored).
+        """
+        if use_cache:
+            cache_args = self._cache_args(prompt, context, profile)
+            cached = resources.get_response_cache().lookup("lesson", *cache_args)
+            if cached is not None:
+                yield cached
+                return
+
+        full_prompt, prompt_stats = build_prompt(prompt, context, profile, history)
+        start = time.perf_counter()
+        first_token = None
+        deltas = 0
+        parts = []
 
         try:
-            resp = client.chat.completions.create(
+            stream = resources.get_llm_client().stream_chat(
                 model="llama-3.3-70b-versatile",
                 messages=[
                     {"role": "system", "content": "You are MindGap AI – friendly, adaptive learning assistant."},
                     {"role": "user", "content": full_prompt}
                 ],
                 temperature=0.7,
-                max_tokens=1200
+                max_tokens=1200,
+                priority=INTERACTIVE
             )
-            return resp.choices[0].message.content.strip()
+            for delta in stream:
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+                deltas += 1
+                parts.append(delta)
+                yield delta
+            if use_cache and parts:
+                resources.get_response_cache().store(
+                    "lesson", *cache_args, "".join(parts).strip(), time.perf_counter() - start
+                )
         except Exception as e:
-            return f"I apologize, but I'm having trouble connecting to the AI service. Error: {str(e)}\n\nPlease check your GROQ_API_KEY in the .env file and ensure it's valid."
+            yield f"I apologize, but I'm having trouble connecting to the AI service. Error: {str(e)}\n\nPlease check your GROQ_API_KEY in the .env file and ensure it's valid."
+        finally:
+            latency_log.append({
+                "ttft": first_token,
+                "total": time.perf_counter() - start,
+                "deltas": deltas,
+                "prompt_tokens": prompt_stats["prompt_tokens"],
+            })
+
+    def generate_response(self, prompt, context="", profile={}, history=[], use_cache=False):
+        return "".join(self.stream_response(prompt, context, profile, history, use_cache)).strip()
+
+    def generate_quiz(self, topic, context="", profile={}, use_cache=True):
+        if use_cache:
+            cache_args = self._cache_args(topic, context, profile)
+            cached = resources.get_response_cache().lookup("quiz", *cache_args)
+            if cached is not None:
+                return cached
+        context = self._context_text(context)
 
-    def generate_quiz(self, topic, context="", profile={}):
         prompt = f"""Based on topic '{topic}' and context:\n{context}
 
 Create 3 multiple-choice questions (JSON array).
@@ -144,12 +381,68 @@ Each question must have:
 Output **only** valid JSON array, nothing else.
 """
         try:
-            resp = client.chat.completions.create(
+            start = time.perf_counter()
+            content = resources.get_llm_client().chat(
                 model="llama-3.3-70b-versatile",
                 messages=[{"role": "user", "content": prompt}],
-                temperature=0.4
+                temperature=0.4,
+                priority=INTERACTIVE
             )
-            return json.loads(resp.choices[0].message.content)
+            quiz = json.loads(content)
+            if use_cache and quiz:
+                resources.get_response_cache().store("quiz", *cache_args, quiz, time.perf_counter() - start)
+            return quiz
         except Exception as e:
             print(f"Quiz generation error: {e}")
             return []
+
+    def summarize_conversation(self, summary, turns):
+        """
+        Fold turns into a running conversation summary (for ConversationMemory).
+        Runs at background priority on a small, fast model.
+        """
+        turns_text = "\n".join(f"User: {t['user']}\nAI: {t['ai']}" for t in turns)
+        prompt = f"""Current summary of a tutoring conversation:
+{summary or "(empty)"}
+
+New exchanges:
+{turns_text}
+
+Rewrite the summary to include the new exchanges in at most 150 words. Keep topics covered,
+what the student struggled with and any preferences they stated. Output only the summary.
+"""
+        return resources.get_llm_client().chat(
+            model=SUMMARY_MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.2,
+            max_tokens=300,
+            priority=BACKGROUND
+        )
+
+    def start_quiz(self, topic, context="", profile={}, use_cache=True):
+        """
+        Generate the quiz in the background; returns a future
+        """
+        return generation_pool.submit(self.generate_quiz, topic, context, profile, use_cache)
+
+    def start_lesson_and_quiz(self, topic, context="", profile={}, history=[], use_cache=False):
+        """
+        Run generate_response and generate_quiz concurrently on the shared
+        generation pool. Returns (lesson_future, quiz_future) so callers can
+        show the lesson while the quiz is still being written.
+        """
+        lesson_future = generation_pool.submit(self.generate_response, topic, context, profile, history, use_cache)
+        return lesson_future, self.start_quiz(topic, context, profile, use_cache)
+
+    def generate_lesson_and_quiz(self, topic, context="", profile={}, history=[], on_lesson=None,
+                                 use_cache=False):
+        """
+        Blocking variant of start_lesson_and_quiz: returns (lesson, quiz)
+        once both finish. on_lesson(lesson) is called as soon as the lesson
+        is ready, from the calling thread.
+        """
+        lesson_future, quiz_future = self.start_lesson_and_quiz(topic, context, profile, history, use_cache)
+        lesson = lesson_future.result()
+        if on_lesson:
+            on_lesson(lesson)
+        return lesson, quiz_future.result()
@@ -0,0 +1,93 @@
+import os
+import time
+import threading
+from collections import deque
+
+RERANK_ENABLED = os.getenv("MINDGAP_RERANK", "0") == "1"
+RERANK_MODEL = os.getenv("MINDGAP_RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# "torch", "onnx" or "onnx-int8" (dynamically quantized ONNX export of the same model)
+RERANK_BACKEND = os.getenv("MINDGAP_RERANK_BACKEND", "torch")
+RERANK_CANDIDATES = int(os.getenv("MINDGAP_RERANK_CANDIDATES", "50"))
+RERANK_BUDGET_MS = float(os.getenv("MINDGAP_RERANK_BUDGET_MS", "150"))
+RERANK_BATCH_SIZE = 16
+RERANK_MAX_LENGTH = 256
+ONNX_INT8_FILE = "onnx/model_qint8_avx512.onnx"
+
+
+class Reranker:
+    """
+    Second-stage cross-encoder reranker with a latency budget.
+
+    Candidates are scored in batches; if the budget runs out before all of
+    them are scored, the first-stage order is returned unchanged. Every
+    query's timing is kept in timings.
+    """
+
+    def __init__(self, model_name=RERANK_MODEL, backend=RERANK_BACKEND,
+                 budget_ms=RERANK_BUDGET_MS, batch_size=RERANK_BATCH_SIZE):
+        self.model_name = model_name
+        self.backend = backend
+        self.budget_ms = budget_ms
+        self.batch_size = batch_size
+        self.timings = deque(maxlen=500)
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        from sentence_transformers import CrossEncoder
+        if self.backend == "torch":
+            return CrossEncoder(self.model_name, max_length=RERANK_MAX_LENGTH)
+        try:
+            kwargs = {"model_kwargs": {"file_name": ONNX_INT8_FILE}} if self.backend == "onnx-int8" else {}
+            return CrossEncoder(self.model_name, max_length=RERANK_MAX_LENGTH, backend="onnx", **kwargs)
+        except Exception as e:
+            print(f"ONNX reranker unavailable ({e}); falling back to PyTorch")
+            return CrossEncoder(self.model_name, max_length=RERANK_MAX_LENGTH)
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._load()
+        return self._model
+
+    def rerank(self, query, candidates, top_k=3):
+        """
+        Return the top_k candidates (texts or search hits) by cross-encoder
+        score, or the first top_k in first-stage order if the latency budget
+        is exceeded
+        """
+        if len(candidates) <= 1:
+            return candidates[:top_k]
+        model = self.model  # loading is not charged to the query budget
+        start = time.perf_counter()
+        scores = []
+        fallback = False
+        for i in range(0, len(candidates), self.batch_size):
+            if (time.perf_counter() - start) * 1000 > self.budget_ms:
+                fallback = True
+                break
+            batch = candidates[i:i + self.batch_size]
+            pairs = [(query, c["text"] if isinstance(c, dict) else c) for c in batch]
+            scores.extend(model.predict(pairs, batch_size=self.batch_size))
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.timings.append({"candidates": len(candidates), "scored": len(scores),
+                             "ms": elapsed_ms, "fallback": fallback})
+        if fallback:
+            return candidates[:top_k]
+        order = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)
+        return [candidates[i] for i in order[:top_k]]
+
+    def stats(self):
+        entries = list(self.timings)
+        if not entries:
+            return {"queries": 0}
+        ms = sorted(e["ms"] for e in entries)
+        return {
+            "queries": len(entries),
+            "p50_ms": ms[len(ms) // 2],
+            "p95_ms": ms[min(len(ms) - 1, int(len(ms) * 0.95))],
+            "fallback_rate": sum(e["fallback"] for e in entries) / len(entries),
+        }
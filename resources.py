@@ -0,0 +1,205 @@
+import os
+import time
+import threading
+from dotenv import load_dotenv
+from reranker import RERANK_ENABLED
+from speech import STT_WARMUP
+
+load_dotenv()
+
+EMBED_MODEL_NAME = 'all-MiniLM-L6-v2'
+PINECONE_INDEX_NAME = "mindgap-index"
+DIMENSION = 384
+
+# Process-wide registry: every Streamlit session shares the same instances.
+_resources = {}
+_locks = {}
+_registry_lock = threading.Lock()
+
+# Seconds spent creating each resource, e.g. {"embed_model": 4.2}
+startup_timings = {}
+
+
+def _get(name, factory):
+    """
+    Return the named resource, creating it with factory() on first use
+    """
+    if name in _resources:
+        return _resources[name]
+
+    with _registry_lock:
+        lock = _locks.setdefault(name, threading.Lock())
+
+    with lock:
+        if name not in _resources:
+            start = time.perf_counter()
+            _resources[name] = factory()
+            startup_timings[name] = time.perf_counter() - start
+    return _resources[name]
+
+
+def is_loaded(name):
+    """
+    Whether the named resource has been created, without creating it
+    """
+    return name in _resources
+
+
+def pinecone_enabled():
+    def check():
+        if not os.getenv("PINECONE_API_KEY"):
+            return False
+        try:
+            import pinecone  # noqa: F401
+            return True
+        except ImportError:
+            return False
+    return _get("pinecone_enabled", check)
+
+
+def get_embed_model():
+    """
+    Embedding model on the backend picked by MINDGAP_EMBED_BACKEND
+    """
+    def load():
+        from embedding_backend import Embedder
+        return Embedder(EMBED_MODEL_NAME)
+    return _get("embed_model", load)
+
+
+def get_embedder():
+    """
+    Cached embedding front-end; the model itself only loads on a cache miss
+    """
+    def create():
+        from embedding_cache import EmbeddingCache
+        from embedding_backend import cache_name
+        return EmbeddingCache(cache_name(EMBED_MODEL_NAME), lambda texts: get_embed_model().encode(texts))
+    return _get("embedder", create)
+
+
+def get_response_cache():
+    def create():
+        from response_cache import ResponseCache
+        return ResponseCache(lambda texts: get_embedder().encode(texts))
+    return _get("response_cache", create)
+
+
+def get_llm_client():
+    """
+    Pooled, rate-limit-aware Groq client (see llm_client.LLMClient)
+    """
+    def connect():
+        from llm_client import LLMClient
+        return LLMClient(
+            api_key=os.getenv("GROQ_API_KEY"),
+            base_url="https://api.groq.com/openai/v1",
+            max_concurrency=int(os.getenv("MINDGAP_LLM_CONCURRENCY", "8")),
+        )
+    return _get("llm_client", connect)
+
+
+def get_vector_index():
+    def connect():
+        from pinecone import Pinecone
+        pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+        existing_indexes = [index.name for index in pc.list_indexes()]
+        if PINECONE_INDEX_NAME not in existing_indexes:
+            pc.create_index(
+                name=PINECONE_INDEX_NAME,
+                dimension=DIMENSION,
+                metric='cosine',
+                spec={'serverless': {'cloud': 'aws', 'region': 'us-east-1'}}
+            )
+        return pc.Index(PINECONE_INDEX_NAME)
+    return _get("vector_index", connect)
+
+
+def get_local_store():
+    def load():
+        from vector_store import LocalVectorStore
+        store = LocalVectorStore(dimension=DIMENSION)
+        store.count()  # read the persisted index now rather than on the first query
+        return store
+    return _get("local_store", load)
+
+
+def get_lexical_index():
+    """
+    BM25 index over chunk texts; backfilled from the local store on first use
+    """
+    def load():
+        from lexical_index import LexicalIndex
+        index = LexicalIndex()
+        if not pinecone_enabled() and index.count() == 0:
+            for rows in get_local_store().iter_chunks():
+                index.add([r[0] for r in rows], [r[1] for r in rows], [r[2] for r in rows])
+        return index
+    return _get("lexical_index", load)
+
+
+def get_reranker():
+    """
+    Cross-encoder reranker for the optional second search stage
+    """
+    def load():
+        from reranker import Reranker
+        return Reranker()
+    return _get("reranker", load)
+
+
+def get_speech_recognizer():
+    """
+    Shared speech-to-text service; the model loads on first use or warm-up
+    """
+    def create():
+        from speech import SpeechRecognizer
+        return SpeechRecognizer()
+    return _get("speech_recognizer", create)
+
+
+def memory_report():
+    """
+    Approximate bytes held by each loaded component, plus the process's
+    peak resident set size where the platform reports it
+    """
+    report = {}
+    if "local_store" in _resources:
+        for name, size in get_local_store().memory_usage().items():
+            report[f"vector_store.{name}"] = size
+    if "embedder" in _resources:
+        report["embedding_cache"] = get_embedder().stats()["memory_bytes"]
+    try:
+        import resource
+        # ru_maxrss is in kilobytes on Linux
+        report["peak_rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:
+        pass
+    return report
+
+
+def warm_up(background=True):
+    """
+    Create the models and vector store ahead of the first request.
+    Failures are left for the first real caller to surface.
+    """
+    def run():
+        getters = [get_embed_model, get_llm_client]
+        getters.append(get_vector_index if pinecone_enabled() else get_local_store)
+        getters.append(get_lexical_index)
+        if RERANK_ENABLED:
+            getters.append(lambda: get_reranker().model)
+        if STT_WARMUP:
+            getters.append(lambda: get_speech_recognizer().model)
+        for getter in getters:
+            try:
+                getter()
+            except Exception as e:
+                print(f"Warm-up of {getter.__name__} failed: {e}")
+
+    if not background:
+        run()
+        return None
+    thread = threading.Thread(target=run, name="mindgap-warmup", daemon=True)
+    thread.start()
+    return thread
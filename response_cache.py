@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import numpy as np
+
+from config import DATA_DIR
+
+SIMILARITY_THRESHOLD = float(os.getenv("MINDGAP_RESPONSE_CACHE_THRESHOLD", "0.92"))
+TTL_SECONDS = int(os.getenv("MINDGAP_RESPONSE_CACHE_TTL", str(7 * 24 * 3600)))
+MAX_ENTRIES = int(os.getenv("MINDGAP_RESPONSE_CACHE_SIZE", "5000"))
+
+
+class ResponseCache:
+    """
+    Semantic cache for generated lessons and quizzes.
+
+    Entries are keyed by kind ("lesson"/"quiz"), difficulty, language and
+    the retrieved context, and matched on topic embedding: a request hits
+    when its topic is within SIMILARITY_THRESHOLD cosine similarity of a
+    cached one. Entries expire after TTL_SECONDS and the least recently
+    used ones are evicted past MAX_ENTRIES. Stored in SQLite, so the cache
+    survives restarts.
+    """
+
+    def __init__(self, embed_fn, path=None, threshold=SIMILARITY_THRESHOLD,
+                 ttl_seconds=TTL_SECONDS, max_entries=MAX_ENTRIES):
+        self.embed_fn = embed_fn
+        self.path = path or os.path.join(DATA_DIR, "responses.db")
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = self._connect()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                difficulty TEXT,
+                language TEXT,
+                context_key TEXT,
+                topic TEXT,
+                embedding BLOB NOT NULL,
+                response TEXT NOT NULL,
+                latency REAL,
+                created_at REAL,
+                last_hit REAL
+            )
+        ''')
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_responses_key
+            ON responses (kind, difficulty, language, context_key)
+        ''')
+        conn.commit()
+        conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _embed(self, topic):
+        vector = np.asarray(self.embed_fn([topic])[0], dtype='float32')
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def lookup(self, kind, topic, difficulty, language, context_key):
+        """
+        Return the cached response for a near-duplicate request, or None
+        """
+        query = self._embed(topic)
+        conn = self._connect()
+        rows = conn.execute('''
+            SELECT id, embedding, response, latency
+            FROM responses
+            WHERE kind = ? AND difficulty = ? AND language = ? AND context_key = ?
+              AND created_at > ?
+        ''', (kind, difficulty, language, context_key, time.time() - self.ttl_seconds)).fetchall()
+
+        best = None
+        if rows:
+            matrix = np.vstack([np.frombuffer(r[1], dtype='float32') for r in rows])
+            scores = matrix @ query
+            i = int(np.argmax(scores))
+            if scores[i] >= self.threshold:
+                best = rows[i]
+
+        if best:
+            conn.execute('UPDATE responses SET last_hit = ? WHERE id = ?', (time.time(), best[0]))
+            conn.commit()
+        conn.close()
+
+        with self._lock:
+            if best:
+                self.hits += 1
+                self.seconds_saved += best[3] or 0.0
+            else:
+                self.misses += 1
+        return json.loads(best[2]) if best else None
+
+    def store(self, kind, topic, difficulty, language, context_key, response, latency):
+        now = time.time()
+        conn = self._connect()
+        conn.execute('''
+            INSERT INTO responses
+            (kind, difficulty, language, context_key, topic, embedding, response, latency, created_at, last_hit)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (kind, difficulty, language, context_key, topic, self._embed(topic).tobytes(),
+              json.dumps(response), latency, now, now))
+
+        # Evict expired entries, then the least recently used ones past the size limit
+        conn.execute('DELETE FROM responses WHERE created_at <= ?', (now - self.ttl_seconds,))
+        conn.execute('''
+            DELETE FROM responses WHERE id IN (
+                SELECT id FROM responses ORDER BY last_hit DESC LIMIT -1 OFFSET ?
+            )
+        ''', (self.max_entries,))
+        conn.commit()
+        conn.close()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "seconds_saved": self.seconds_saved,
+        }
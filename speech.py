@@ -0,0 +1,168 @@
+import os
+import io
+import time
+import wave
+import subprocess
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# "whisper" (openai-whisper, PyTorch) or "faster-whisper" (CTranslate2, int8 on CPU)
+STT_BACKEND = os.getenv("MINDGAP_STT_BACKEND", "whisper")
+STT_MODEL = os.getenv("MINDGAP_STT_MODEL", "base")
+STT_COMPUTE_TYPE = os.getenv("MINDGAP_STT_COMPUTE_TYPE", "int8")
+# openai-whisper models are not safe to call from several threads at once;
+# faster-whisper runs this many transcriptions in parallel
+STT_CONCURRENCY = int(os.getenv("MINDGAP_STT_CONCURRENCY", "1"))
+STT_MAX_QUEUE = int(os.getenv("MINDGAP_STT_MAX_QUEUE", "16"))
+STT_WARMUP = os.getenv("MINDGAP_STT_WARMUP", "0") == "1"
+STT_TIMEOUT = 120.0
+SAMPLE_RATE = 16000   # what Whisper models expect
+
+
+class SpeechBusy(Exception):
+    pass
+
+
+def _resample(samples, rate):
+    if rate == SAMPLE_RATE or len(samples) == 0:
+        return samples
+    if rate > SAMPLE_RATE:
+        # Box low-pass before decimating, so high frequencies don't alias into speech
+        width = int(np.ceil(rate / SAMPLE_RATE))
+        samples = np.convolve(samples, np.ones(width, dtype='float32') / width, mode='same')
+    n_out = int(round(len(samples) * SAMPLE_RATE / rate))
+    return np.interp(np.linspace(0, len(samples) - 1, n_out), np.arange(len(samples)), samples).astype('float32')
+
+
+def _decode_wav(data):
+    with wave.open(io.BytesIO(data)) as wav:
+        channels, width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+        frames = wav.readframes(wav.getnframes())
+    if width == 1:
+        samples = (np.frombuffer(frames, dtype='uint8').astype('float32') - 128) / 128
+    elif width == 2:
+        samples = np.frombuffer(frames, dtype='<i2').astype('float32') / 32768
+    elif width == 4:
+        samples = np.frombuffer(frames, dtype='<i4').astype('float32') / 2147483648
+    else:
+        raise wave.Error(f"unsupported sample width {width}")
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return _resample(samples, rate)
+
+
+def _decode_ffmpeg(data):
+    # Same conversion openai-whisper's load_audio does, but through pipes instead of a file
+    result = subprocess.run(
+        ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", "pipe:0",
+         "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1"],
+        input=data, capture_output=True, check=True,
+    )
+    return np.frombuffer(result.stdout, dtype='<i2').astype('float32') / 32768
+
+
+def decode_audio(data):
+    """
+    Decode recorded audio bytes in memory to 16 kHz mono float32. PCM WAV
+    is decoded directly; anything else (float WAV, WebM, MP3) is piped
+    through ffmpeg. Nothing touches the filesystem.
+    """
+    try:
+        return _decode_wav(data)
+    except (wave.Error, EOFError):
+        return _decode_ffmpeg(data)
+
+
+class SpeechRecognizer:
+    """
+    Process-wide speech-to-text service: one shared model, a bounded
+    request queue served by STT_CONCURRENCY workers, and per-request
+    queue-wait and transcription timings.
+    """
+
+    def __init__(self, backend=STT_BACKEND, model_name=STT_MODEL, compute_type=STT_COMPUTE_TYPE,
+                 concurrency=STT_CONCURRENCY, max_queue=STT_MAX_QUEUE):
+        if backend not in ("whisper", "faster-whisper"):
+            raise ValueError(f"Unknown speech backend {backend!r}; expected whisper or faster-whisper")
+        self.backend = backend
+        self.model_name = model_name
+        self.compute_type = compute_type
+        self.concurrency = max(1, concurrency if backend == "faster-whisper" else 1)
+        self.max_queue = max_queue
+        self.timings = deque(maxlen=500)
+        self._model = None
+        self._lock = threading.Lock()        # guards _pending; never held for long
+        self._load_lock = threading.Lock()   # held while the model loads (seconds)
+        self._pending = 0
+        self._pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="mindgap-stt")
+
+    def _load(self):
+        if self.backend == "faster-whisper":
+            from faster_whisper import WhisperModel
+            return WhisperModel(self.model_name, device="cpu", compute_type=self.compute_type,
+                                num_workers=self.concurrency)
+        import whisper
+        return whisper.load_model(self.model_name, device="cpu")
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    self._model = self._load()
+        return self._model
+
+    def _transcribe(self, audio, language, queued_at):
+        started = time.perf_counter()
+        model = self.model
+        loaded = time.perf_counter()
+        if self.backend == "faster-whisper":
+            segments, _ = model.transcribe(audio, language=language, beam_size=1)
+            text = " ".join(segment.text.strip() for segment in segments)
+        else:
+            text = model.transcribe(audio, language=language, fp16=False)["text"]
+        finished = time.perf_counter()
+        self.timings.append({
+            "queue_wait": started - queued_at,
+            "load": loaded - started,
+            "transcribe": finished - loaded,
+            "total": finished - queued_at,
+        })
+        return text.strip()
+
+    def transcribe(self, audio, language="en", timeout=STT_TIMEOUT):
+        """
+        Transcribe audio (encoded bytes, a file path or a 16 kHz mono
+        float32 array), waiting for a free worker. Raises SpeechBusy if the
+        queue is full.
+        """
+        if isinstance(audio, (bytes, bytearray)):
+            audio = decode_audio(bytes(audio))
+        with self._lock:
+            if self._pending >= self.max_queue:
+                raise SpeechBusy("Speech recognition is busy; please try again in a moment")
+            self._pending += 1
+        try:
+            future = self._pool.submit(self._transcribe, audio, language, time.perf_counter())
+            return future.result(timeout=timeout)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def stats(self):
+        entries = list(self.timings)
+        with self._lock:
+            queued = self._pending
+        if not entries:
+            return {"requests": 0, "queued": queued}
+        totals = sorted(e["transcribe"] for e in entries)
+        waits = sorted(e["queue_wait"] for e in entries)
+        return {
+            "requests": len(entries),
+            "queued": queued,
+            "transcribe_p50": totals[len(totals) // 2],
+            "transcribe_p95": totals[min(len(totals) - 1, int(len(totals) * 0.95))],
+            "queue_wait_p50": waits[len(waits) // 2],
+        }
@@ -0,0 +1,558 @@
+import os
+import json
+import zlib
+import sqlite3
+import threading
+import numpy as np
+import faiss
+
+from config import DATA_DIR
+
+# Index tiers: "flat" stays exact forever; "ivf", "ivfpq" and "hnsw" promote
+# to that ANN index once the corpus passes ANN_THRESHOLD chunks. "auto" picks
+# IVF-Flat, or IVF-PQ for very large corpora. The ANN tier is kept in addition
+# to the exact index, so IVF-PQ only lowers memory overall together with a
+# compact VECTOR_CODEC.
+INDEX_TYPE = os.getenv("MINDGAP_INDEX_TYPE", "auto")
+ANN_THRESHOLD = int(os.getenv("MINDGAP_ANN_THRESHOLD", "50000"))
+PQ_THRESHOLD = int(os.getenv("MINDGAP_PQ_THRESHOLD", "1000000"))
+NPROBE = int(os.getenv("MINDGAP_NPROBE", "16"))
+EF_SEARCH = int(os.getenv("MINDGAP_EF_SEARCH", "64"))
+HNSW_M = 32
+PQ_SUBQUANTIZERS = 48
+DEAD_RETRAIN_FRACTION = 0.1   # rebuild the ANN tier once this share of its entries are deleted chunks
+
+# In-memory codec of the exact index: "float32", "float16" (half the memory)
+# or "sq8" (8-bit scalar quantization, a quarter). Results from lossy codecs
+# and from IVF-PQ are re-scored exactly against the raw vectors on disk.
+VECTOR_CODEC = os.getenv("MINDGAP_VECTOR_CODEC", "float32")
+RESCORE = os.getenv("MINDGAP_RESCORE", "1") == "1"
+RESCORE_FACTOR = 4          # candidates fetched per result before re-scoring
+COMPRESS_TEXTS = os.getenv("MINDGAP_COMPRESS_TEXTS", "1") == "1"
+SQLITE_MMAP_BYTES = 256 << 20
+LOAD_BLOCK_ROWS = 65536     # raw vectors read per block (~100 MB at 384 dims)
+
+# Bumped when the ANN index layout changes, so stale ann.faiss files are retrained
+ANN_VERSION = 2
+
+METADATA_COLUMNS = [("doc_id", "TEXT"), ("source", "TEXT"), ("page_start", "INTEGER"), ("page_end", "INTEGER"),
+                    ("offset_start", "INTEGER"), ("offset_end", "INTEGER")]
+# Chunk texts are zlib-compressed into text_z; text stays empty for those rows
+STORAGE_COLUMNS = [("text_z", "BLOB")]
+
+
+def _decode_text(text, text_z):
+    return zlib.decompress(text_z).decode('utf-8') if text_z is not None else text
+
+
+def normalize(vectors):
+    """
+    L2-normalize rows so inner product equals cosine similarity
+    """
+    vectors = np.ascontiguousarray(vectors, dtype='float32').copy()
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+class LocalVectorStore:
+    """
+    Persistent FAISS store used when Pinecone is not configured.
+
+    Layout of the data directory:
+    - vectors.f32: append-only raw float32 vectors (normalized on write;
+      files from older releases are normalized when loaded)
+    - ids.i64: append-only int64 chunk ids (same order as vectors.f32)
+    - chunks.db: SQLite chunk table (id -> compressed text, document
+      metadata), read through a memory map
+    - ann.faiss / ann.json: trained ANN index and the last chunk id it covers
+
+    Nothing is read until the first search/add, and a warm start only
+    copies the raw vectors into the index - no re-embedding.
+
+    Vectors are unit length and every index uses inner product, so scores
+    are cosine similarities (higher is better), the same metric as the
+    Pinecone index.
+
+    The exact flat index is always kept; it answers queries until the ANN
+    tier has been trained in the background, and it is the baseline for
+    recall checks. With a compact codec it holds float16 or 8-bit codes,
+    and full-precision vectors are only read back from vectors.f32 (memory
+    mapped) to re-score candidates, train the ANN tier or scan a document.
+    An ANN tier adds to this index's memory rather than replacing it, so
+    IVF-PQ saves memory only when the codec is sq8 or float16.
+    """
+
+    def __init__(self, data_dir=DATA_DIR, dimension=384, index_type=INDEX_TYPE,
+                 ann_threshold=ANN_THRESHOLD, nprobe=NPROBE, ef_search=EF_SEARCH,
+                 codec=VECTOR_CODEC, rescore=RESCORE):
+        if codec not in ("float32", "float16", "sq8"):
+            raise ValueError(f"Unknown vector codec {codec!r}; expected float32, float16 or sq8")
+        self.data_dir = data_dir
+        self.dimension = dimension
+        self.codec = codec
+        self.rescore = rescore
+        self.index_type = index_type
+        self.ann_threshold = ann_threshold
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.vectors_path = os.path.join(data_dir, "vectors.f32")
+        self.ids_path = os.path.join(data_dir, "ids.i64")
+        self.db_path = os.path.join(data_dir, "chunks.db")
+        self.ann_path = os.path.join(data_dir, "ann.faiss")
+        self.ann_meta_path = os.path.join(data_dir, "ann.json")
+        self._lock = threading.RLock()
+        self._index = None
+        self._rows_loaded = 0
+        self._ann = None
+        self._ann_kind = None
+        self._ann_trained_on = 0
+        self._ann_dead = set()   # deleted ids still in the ANN index (HNSW can't delete)
+        self._training = None
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute(f'PRAGMA mmap_size = {SQLITE_MMAP_BYTES}')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS chunks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                text TEXT NOT NULL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        # Document metadata and compressed text columns were added after the first release
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(chunks)')}
+        for name, kind in METADATA_COLUMNS + STORAGE_COLUMNS:
+            if name not in columns:
+                conn.execute(f'ALTER TABLE chunks ADD COLUMN {name} {kind}')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_chunks_doc_id ON chunks (doc_id)')
+        return conn
+
+    def _raw_row_count(self):
+        if not os.path.exists(self.ids_path):
+            return 0
+        id_rows = os.path.getsize(self.ids_path) // 8
+        vec_rows = os.path.getsize(self.vectors_path) // (4 * self.dimension)
+        # A torn write leaves one file longer than the other; ignore the tail
+        return min(id_rows, vec_rows)
+
+    def _read_raw(self, start, stop):
+        count = stop - start
+        ids = np.fromfile(self.ids_path, dtype='int64', count=count, offset=start * 8)
+        vectors = np.fromfile(
+            self.vectors_path, dtype='float32',
+            count=count * self.dimension, offset=start * 4 * self.dimension
+        ).reshape(-1, self.dimension)
+        return ids, normalize(vectors)
+
+    def _vectors_for(self, ids):
+        """
+        Full-precision vectors for loaded chunk ids, read through a memory
+        map of the raw files rather than decoded from the index
+        """
+        rows = self._raw_row_count()
+        raw_ids = np.memmap(self.ids_path, dtype='int64', mode='r', shape=(rows,))
+        # Ids are appended in increasing order (a failed write truncates its
+        # rows again). Only a crash between the append and the commit leaves
+        # an earlier copy of an id; take the last one.
+        positions = np.searchsorted(raw_ids, ids, side='right') - 1
+        raw_vectors = np.memmap(self.vectors_path, dtype='float32', mode='r', shape=(rows, self.dimension))
+        return normalize(raw_vectors[positions])
+
+    def _new_exact_index(self):
+        if self.codec == "float16":
+            inner = faiss.IndexScalarQuantizer(self.dimension, faiss.ScalarQuantizer.QT_fp16,
+                                               faiss.METRIC_INNER_PRODUCT)
+        elif self.codec == "sq8":
+            inner = faiss.IndexScalarQuantizer(self.dimension, faiss.ScalarQuantizer.QT_8bit_uniform,
+                                               faiss.METRIC_INNER_PRODUCT)
+            # Unit vectors lie in [-1, 1], so one fixed range needs no training data
+            inner.train(np.vstack([-np.ones(self.dimension), np.ones(self.dimension)]).astype('float32'))
+        else:
+            inner = faiss.IndexFlatIP(self.dimension)
+        return faiss.IndexIDMap2(inner)
+
+    def _ensure_loaded(self):
+        with self._lock:
+            if self._index is not None:
+                return
+            os.makedirs(self.data_dir, exist_ok=True)
+            self._index = self._new_exact_index()
+
+            rows = self._raw_row_count()
+            if rows:
+                conn = self._connect()
+                committed = np.array([r[0] for r in conn.execute('SELECT id FROM chunks')], dtype='int64')
+                conn.close()
+                # Read in blocks so a compact codec never needs the whole
+                # float32 corpus in memory at once
+                for start in range(0, rows, LOAD_BLOCK_ROWS):
+                    ids, vectors = self._read_raw(start, min(start + LOAD_BLOCK_ROWS, rows))
+                    # Vectors appended by a write whose SQLite commit never happened are dropped
+                    keep = np.isin(ids, committed)
+                    self._index.add_with_ids(vectors[keep], ids[keep])
+            self._rows_loaded = rows
+            self._load_ann()
+            self._maybe_promote()
+
+    def _sync(self):
+        """
+        Pick up rows appended by other processes since the last load
+        """
+        rows = self._raw_row_count()
+        for start in range(self._rows_loaded, rows, LOAD_BLOCK_ROWS):
+            ids, vectors = self._read_raw(start, min(start + LOAD_BLOCK_ROWS, rows))
+            self._add_to_indexes(vectors, ids)
+            self._rows_loaded = start + len(ids)
+
+    def _add_to_indexes(self, vectors, ids):
+        self._index.add_with_ids(vectors, ids)
+        if self._ann is not None:
+            self._ann.add_with_ids(vectors, ids)
+        self._maybe_promote()
+
+    # ── ANN tier ──────────────────────────────────
+
+    def _target_kind(self, n):
+        if self.index_type == "flat" or n < self.ann_threshold:
+            return None
+        if self.index_type == "auto":
+            return "ivfpq" if n >= PQ_THRESHOLD else "ivf"
+        return self.index_type
+
+    def _build_ann(self, kind, vectors, ids):
+        n = len(vectors)
+        if kind == "hnsw":
+            ann = faiss.IndexIDMap2(faiss.IndexHNSWFlat(self.dimension, HNSW_M, faiss.METRIC_INNER_PRODUCT))
+        else:
+            nlist = max(1, min(int(4 * np.sqrt(n)), n // 39))
+            quantizer = faiss.IndexFlatIP(self.dimension)
+            if kind == "ivfpq":
+                ann = faiss.IndexIVFPQ(quantizer, self.dimension, nlist, PQ_SUBQUANTIZERS, 8,
+                                       faiss.METRIC_INNER_PRODUCT)
+            else:
+                ann = faiss.IndexIVFFlat(quantizer, self.dimension, nlist, faiss.METRIC_INNER_PRODUCT)
+            # ~256 points per list is plenty for k-means
+            sample = vectors[np.random.permutation(n)[:256 * nlist]]
+            ann.train(sample)
+        ann.add_with_ids(vectors, ids)
+        return ann
+
+    def _apply_search_params(self, ann, kind):
+        params = faiss.ParameterSpace()
+        if kind == "hnsw":
+            params.set_index_parameter(ann, "efSearch", self.ef_search)
+        else:
+            params.set_index_parameter(ann, "nprobe", self.nprobe)
+
+    def set_search_params(self, nprobe=None, ef_search=None):
+        """
+        Tune ANN recall/speed at runtime (nprobe for IVF, efSearch for HNSW)
+        """
+        with self._lock:
+            if nprobe is not None:
+                self.nprobe = nprobe
+            if ef_search is not None:
+                self.ef_search = ef_search
+            if self._ann is not None:
+                self._apply_search_params(self._ann, self._ann_kind)
+
+    def _maybe_promote(self):
+        n = self._index.ntotal
+        kind = self._target_kind(n)
+        if kind is None or (self._training and self._training.is_alive()):
+            return
+        # Retrain once the corpus has doubled so IVF lists stay balanced, or
+        # once deleted chunks take up a noticeable share of the ANN index
+        if (self._ann is not None and kind == self._ann_kind and n < 2 * self._ann_trained_on
+                and len(self._ann_dead) <= DEAD_RETRAIN_FRACTION * self._ann.ntotal):
+            return
+        self._training = threading.Thread(target=self._train_ann, args=(kind,), daemon=True)
+        self._training.start()
+
+    def _train_ann(self, kind):
+        with self._lock:
+            n = self._index.ntotal
+            ids = faiss.vector_to_array(self._index.id_map).copy()
+            vectors = self._vectors_for(ids)
+
+        ann = self._build_ann(kind, vectors, ids)
+        self._apply_search_params(ann, kind)
+        max_id = int(ids.max()) if len(ids) else 0
+
+        with self._lock:
+            # Catch up on chunks added and removed while training ran
+            live = faiss.vector_to_array(self._index.id_map)
+            tail_ids = live[np.isin(live, ids, invert=True)].copy()
+            if len(tail_ids):
+                ann.add_with_ids(self._vectors_for(tail_ids), tail_ids)
+            dead = self._drop_from_ann(ann, ids[np.isin(ids, live, invert=True)])
+            self._ann, self._ann_kind, self._ann_trained_on, self._ann_dead = ann, kind, n, dead
+
+        faiss.write_index(ann, self.ann_path)
+        with open(self.ann_meta_path, 'w') as f:
+            json.dump({"kind": kind, "trained_on": n, "max_id": max_id, "version": ANN_VERSION}, f)
+
+    def _load_ann(self):
+        if not (os.path.exists(self.ann_path) and os.path.exists(self.ann_meta_path)):
+            return
+        with open(self.ann_meta_path) as f:
+            meta = json.load(f)
+        if meta["kind"] != self._target_kind(self._index.ntotal) or meta.get("version") != ANN_VERSION:
+            return
+        ann = faiss.read_index(self.ann_path)
+        # The saved index only covers ids up to max_id; add the rest from the flat index
+        ids = faiss.vector_to_array(self._index.id_map)
+        newer = np.nonzero(ids > meta["max_id"])[0]
+        if len(newer):
+            ann.add_with_ids(self._vectors_for(ids[newer]), ids[newer])
+        # ...and it still holds chunks removed since it was written
+        raw_ids = np.fromfile(self.ids_path, dtype='int64', count=self._rows_loaded)
+        removed = raw_ids[(raw_ids <= meta["max_id"]) & np.isin(raw_ids, ids, invert=True)]
+        self._apply_search_params(ann, meta["kind"])
+        self._ann, self._ann_kind, self._ann_trained_on = ann, meta["kind"], meta["trained_on"]
+        self._ann_dead = self._drop_from_ann(ann, removed)
+
+    def _drop_from_ann(self, ann, ids):
+        """
+        Remove ids from an ANN index; returns those it can't delete (HNSW),
+        which search() filters out instead
+        """
+        if len(ids) == 0:
+            return set()
+        try:
+            ann.remove_ids(np.asarray(ids, dtype='int64'))
+            return set()
+        except RuntimeError:
+            return {int(i) for i in ids}
+
+    def recall_check(self, query_vectors, top_k=10):
+        """
+        Mean recall@k of the ANN tier against the exact flat index
+        """
+        queries = np.ascontiguousarray(query_vectors, dtype='float32').reshape(-1, self.dimension)
+        exact = self.search(queries, top_k, exact=True)
+        approx = self.search(queries, top_k)
+        recalls = [
+            len({i for i, _ in a} & {i for i, _ in e}) / len(e)
+            for a, e in zip(approx, exact) if e
+        ]
+        return float(np.mean(recalls)) if recalls else 1.0
+
+    def stats(self):
+        with self._lock:
+            self._ensure_loaded()
+            return {
+                "chunks": self._index.ntotal,
+                "codec": self.codec,
+                "ann": self._ann_kind or "flat",
+                "ann_trained_on": self._ann_trained_on,
+                "training": bool(self._training and self._training.is_alive()),
+                "nprobe": self.nprobe,
+                "ef_search": self.ef_search,
+            }
+
+    def _ann_bytes(self):
+        if self._ann is None:
+            return 0
+        n = self._ann.ntotal
+        if self._ann_kind == "hnsw":
+            # full vectors, ~2*M neighbour links per node and the id maps
+            return n * (4 * self.dimension + 8 * HNSW_M + 40)
+        ivf = faiss.extract_index_ivf(self._ann)
+        return n * (ivf.code_size + 8) + ivf.nlist * 4 * self.dimension
+
+    def memory_usage(self):
+        """
+        Approximate bytes per component: indexes held in RAM and the files
+        that are only paged in on demand
+        """
+        with self._lock:
+            self._ensure_loaded()
+            n = self._index.ntotal
+            usage = {
+                "exact_index": n * faiss.downcast_index(self._index.index).sa_code_size(),
+                "id_maps": n * 40,   # id_map vector plus IndexIDMap2's reverse hash map
+                "ann_index": self._ann_bytes(),
+            }
+        for name, path in (("raw_vectors_file", self.vectors_path), ("chunk_db_file", self.db_path)):
+            usage[name] = os.path.getsize(path) if os.path.exists(path) else 0
+        return usage
+
+    def add(self, embeddings, chunks):
+        """
+        Append chunk vectors; chunks are texts or dicts with "text" and
+        optional doc_id/source/page_start/page_end/offset_start/offset_end.
+        Returns the new chunk ids.
+        """
+        vectors = normalize(np.asarray(embeddings, dtype='float32').reshape(-1, self.dimension))
+        if len(vectors) == 0:
+            return []
+
+        with self._lock:
+            self._ensure_loaded()
+            self._sync()
+            conn = self._connect()
+            sizes = None
+            try:
+                # BEGIN IMMEDIATE also serialises writers across processes
+                conn.execute('BEGIN IMMEDIATE')
+                sizes = {path: os.path.getsize(path) if os.path.exists(path) else 0
+                         for path in (self.vectors_path, self.ids_path)}
+                ids = []
+                for chunk in chunks:
+                    meta = chunk if isinstance(chunk, dict) else {"text": chunk}
+                    text, text_z = meta["text"], None
+                    if COMPRESS_TEXTS:
+                        text, text_z = "", zlib.compress(meta["text"].encode('utf-8'))
+                    cur = conn.execute(
+                        'INSERT INTO chunks (text, text_z, doc_id, source, page_start, page_end, offset_start, offset_end) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                        (text, text_z, meta.get("doc_id"), meta.get("source"), meta.get("page_start"),
+                         meta.get("page_end"), meta.get("offset_start"), meta.get("offset_end"))
+                    )
+                    ids.append(cur.lastrowid)
+                ids = np.array(ids, dtype='int64')
+
+                with open(self.vectors_path, 'ab') as f:
+                    f.write(vectors.tobytes())
+                with open(self.ids_path, 'ab') as f:
+                    f.write(ids.tobytes())
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                # The rollback also rewinds the id sequence, so the next write
+                # reuses these ids: drop the rows appended for them
+                for path, size in (sizes or {}).items():
+                    if os.path.exists(path) and os.path.getsize(path) > size:
+                        os.truncate(path, size)
+                raise
+            finally:
+                conn.close()
+
+            self._rows_loaded += len(ids)
+            self._add_to_indexes(vectors, ids)
+            return ids.tolist()
+
+    def remove(self, ids):
+        """
+        Delete chunks by id. Their raw vectors stay on disk but are skipped
+        on the next load because the chunk rows are gone.
+        The saved ANN index is pruned the same way when it is loaded.
+        """
+        ids = np.array(ids, dtype='int64')
+        if len(ids) == 0:
+            return
+        with self._lock:
+            self._ensure_loaded()
+            self._sync()
+            conn = self._connect()
+            conn.executemany('DELETE FROM chunks WHERE id = ?', [(int(i),) for i in ids])
+            conn.commit()
+            conn.close()
+            self._index.remove_ids(ids)
+            if self._ann is not None:
+                self._ann_dead |= self._drop_from_ann(self._ann, ids)
+                self._maybe_promote()
+
+    def search(self, query_vectors, top_k=3, exact=False, doc_id=None):
+        """
+        Return one list of (chunk_id, cosine similarity) pairs per query
+        vector, best first. Uses the ANN tier when it is ready unless
+        exact=True. doc_id limits the search to one document's chunks.
+        """
+        queries = normalize(np.asarray(query_vectors, dtype='float32').reshape(-1, self.dimension))
+        if doc_id is not None:
+            return self._search_document(queries, top_k, doc_id)
+        with self._lock:
+            self._ensure_loaded()
+            self._sync()
+            if self._index.ntotal == 0:
+                return [[] for _ in range(len(queries))]
+            use_ann = not exact and self._ann is not None
+            lossy = self._ann_kind == "ivfpq" if use_ann else self.codec != "float32"
+            rescore = self.rescore and lossy
+            index = self._ann if use_ann else self._index
+            # Fetch enough extra candidates to make up for deleted ids still in the ANN index
+            dead = self._ann_dead if use_ann else set()
+            scores, ids = index.search(queries, (top_k * RESCORE_FACTOR if rescore else top_k) + len(dead))
+            if dead:
+                live = ~np.isin(ids, list(dead))
+                ids, scores = np.where(live, ids, -1), np.where(live, scores, -np.inf)
+            if rescore:
+                return [self._rescore(query, row_ids[row_ids != -1], top_k) for query, row_ids in zip(queries, ids)]
+
+        return [
+            [(int(i), float(s)) for i, s in zip(row_ids, row_scores) if i != -1][:top_k]
+            for row_ids, row_scores in zip(ids, scores)
+        ]
+
+    def _rescore(self, query, ids, top_k):
+        # Exact cosine for the compressed index's candidates
+        if len(ids) == 0:
+            return []
+        scores = self._vectors_for(ids) @ query
+        order = np.argsort(-scores)[:top_k]
+        return [(int(ids[j]), float(scores[j])) for j in order]
+
+    def _search_document(self, queries, top_k, doc_id):
+        # Score only this document's vectors instead of filtering a full scan
+        conn = self._connect()
+        ids = np.array([r[0] for r in conn.execute('SELECT id FROM chunks WHERE doc_id = ?', (doc_id,))],
+                       dtype='int64')
+        conn.close()
+        with self._lock:
+            self._ensure_loaded()
+            self._sync()
+            ids = ids[np.isin(ids, faiss.vector_to_array(self._index.id_map))]
+            if len(ids) == 0:
+                return [[] for _ in range(len(queries))]
+            vectors = self._vectors_for(ids)
+
+        scores = queries @ vectors.T
+        order = np.argsort(-scores, axis=1)[:, :top_k]
+        return [
+            [(int(ids[j]), float(scores[q, j])) for j in row]
+            for q, row in enumerate(order)
+        ]
+
+    def get_chunks(self, ids):
+        """
+        Fetch chunk texts and document metadata by id as a dict of dicts
+        """
+        ids = [int(i) for i in ids]
+        if not ids:
+            return {}
+        conn = self._connect()
+        placeholders = ",".join("?" * len(ids))
+        rows = conn.execute(
+            f'SELECT id, text, text_z, doc_id, source, page_start, page_end, offset_start, offset_end '
+            f'FROM chunks WHERE id IN ({placeholders})', ids
+        ).fetchall()
+        conn.close()
+        return {
+            r[0]: {"text": _decode_text(r[1], r[2]), "doc_id": r[3], "source": r[4], "page_start": r[5],
+                   "page_end": r[6], "offset_start": r[7], "offset_end": r[8]}
+            for r in rows
+        }
+
+    def iter_chunks(self, batch_size=1000):
+        """
+        Yield batches of (id, text, doc_id) rows in id order
+        """
+        conn = self._connect()
+        last_id = 0
+        while True:
+            rows = conn.execute(
+                'SELECT id, text, text_z, doc_id FROM chunks WHERE id > ? ORDER BY id LIMIT ?', (last_id, batch_size)
+            ).fetchall()
+            if not rows:
+                break
+            yield [(r[0], _decode_text(r[1], r[2]), r[3]) for r in rows]
+            last_id = rows[-1][0]
+        conn.close()
+
+    def count(self):
+        with self._lock:
+            self._ensure_loaded()
+            self._sync()
+            return self._index.ntotal
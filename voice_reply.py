@@ -0,0 +1,219 @@
+import os
+import io
+import re
+import time
+import wave
+import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# "gtts" (Google Translate TTS, needs network) or "espeak" (espeak-ng, offline)
+TTS_BACKEND = os.getenv("MINDGAP_TTS_BACKEND", "gtts")
+TTS_WORKERS = int(os.getenv("MINDGAP_TTS_WORKERS", "4"))
+# Sentences after the first are grouped up to this many characters, so a
+# reply of short sentences doesn't become dozens of synthesis requests
+TTS_MIN_CHARS = int(os.getenv("MINDGAP_TTS_MIN_CHARS", "80"))
+FIRST_MIN_CHARS = 20   # keeps list numbers and "e.g." from being spoken on their own
+TTS_TIMEOUT = 60.0
+
+# One entry per spoken reply: time to first sentence and first audio, total time
+reply_log = deque(maxlen=500)
+
+_pool = ThreadPoolExecutor(max_workers=TTS_WORKERS, thread_name_prefix="mindgap-tts")
+
+_SENTENCE_END_RE = re.compile(r'[.!?…]["\')\]]*\s+|\n+')
+_MARKDOWN_RE = re.compile(r'[*_`#>|]+|^\s*[-+]\s+|\[([^\]]*)\]\([^)]*\)', re.M)
+
+
+class GttsBackend:
+    name = "gtts"
+    mime = "audio/mp3"
+
+    def synthesize(self, text, lang):
+        from gtts import gTTS
+        audio_io = io.BytesIO()
+        gTTS(text, lang=lang, slow=False).write_to_fp(audio_io)
+        return audio_io.getvalue()
+
+    def join(self, chunks):
+        # MP3 is a sequence of self-contained frames, so chunks concatenate as-is
+        return b"".join(chunks)
+
+
+class EspeakBackend:
+    name = "espeak"
+    mime = "audio/wav"
+
+    def __init__(self, rate=165):
+        import shutil
+        self.binary = shutil.which("espeak-ng") or shutil.which("espeak")
+        if not self.binary:
+            raise RuntimeError("espeak-ng is not installed")
+        self.rate = rate
+
+    def synthesize(self, text, lang):
+        result = subprocess.run(
+            [self.binary, "--stdout", "--stdin", "-v", lang, "-s", str(self.rate)],
+            input=text.encode('utf-8'), capture_output=True, check=True,
+        )
+        return result.stdout
+
+    def join(self, chunks):
+        return join_wav(chunks)
+
+
+def join_wav(chunks):
+    """
+    Concatenate WAV files that share a sample format into one
+    """
+    frames, params = [], None
+    for chunk in chunks:
+        with wave.open(io.BytesIO(chunk)) as wav:
+            params = params or wav.getparams()
+            frames.append(wav.readframes(wav.getnframes()))
+    out = io.BytesIO()
+    with wave.open(out, 'wb') as wav:
+        wav.setparams(params)
+        wav.writeframes(b"".join(frames))
+    return out.getvalue()
+
+
+BACKENDS = {"gtts": GttsBackend, "espeak": EspeakBackend}
+
+
+def get_backend(name=TTS_BACKEND):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown TTS backend {name!r}; expected one of {list(BACKENDS)}")
+    return BACKENDS[name]()
+
+
+def speakable(text):
+    """
+    Strip markdown that would otherwise be read aloud
+    """
+    return " ".join(_MARKDOWN_RE.sub(lambda m: m.group(1) or " ", text).split())
+
+
+class SentenceSplitter:
+    """
+    Cut a stream of text deltas into speakable sentences as soon as each
+    one ends. The first sentence is released on its own so audio can start
+    early; later ones are grouped up to at least min_chars.
+    """
+
+    def __init__(self, min_chars=TTS_MIN_CHARS):
+        self.min_chars = min_chars
+        self._buffer = ""
+        self._pending = ""
+        self._released = 0
+
+    def feed(self, delta):
+        self._buffer += delta
+        sentences = []
+        while True:
+            match = _SENTENCE_END_RE.search(self._buffer)
+            if not match:
+                break
+            sentence = speakable(self._buffer[:match.end()])
+            self._buffer = self._buffer[match.end():]
+            if sentence:
+                self._pending = f"{self._pending} {sentence}".strip()
+            needed = min(FIRST_MIN_CHARS, self.min_chars) if not self._released else self.min_chars
+            if len(self._pending) >= needed:
+                sentences.append(self._pending)
+                self._pending = ""
+                self._released += 1
+        return sentences
+
+    def flush(self):
+        text = f"{self._pending} {speakable(self._buffer)}".strip()
+        self._buffer = self._pending = ""
+        return [text] if text else []
+
+
+class VoiceReply:
+    """
+    Speak an answer while it is still being generated: text deltas pass
+    through speak() unchanged, each finished sentence is synthesized on a
+    shared thread pool, and audio chunks are handed to on_audio in order,
+    on the caller's thread, as soon as they and all earlier ones are ready.
+    """
+
+    def __init__(self, lang="en", backend=None, min_chars=TTS_MIN_CHARS):
+        if backend is None or isinstance(backend, str):
+            backend = get_backend(backend or TTS_BACKEND)
+        self.backend = backend
+        self.mime = backend.mime
+        self.lang = lang
+        self.chunks = []
+        self._splitter = SentenceSplitter(min_chars)
+        self._futures = []
+        self._started = time.perf_counter()
+        self._first_sentence = None
+        self._first_audio = None
+
+    def _submit(self, sentences):
+        for sentence in sentences:
+            if self._first_sentence is None:
+                self._first_sentence = time.perf_counter() - self._started
+            self._futures.append(_pool.submit(self.backend.synthesize, sentence, self.lang))
+
+    def _deliver(self, on_audio, wait):
+        while len(self.chunks) < len(self._futures):
+            future = self._futures[len(self.chunks)]
+            if not wait and (not future.done() or future.exception() is not None):
+                # Failures are raised by finish(), not in the middle of the text stream
+                return
+            chunk = future.result(timeout=TTS_TIMEOUT)
+            if self._first_audio is None:
+                self._first_audio = time.perf_counter() - self._started
+            self.chunks.append(chunk)
+            if on_audio:
+                on_audio(chunk)
+
+    def speak(self, deltas, on_audio=None):
+        """
+        Yield deltas from the LLM stream, queueing sentences for synthesis
+        and passing audio that is ready to on_audio between deltas
+        """
+        for delta in deltas:
+            yield delta
+            self._submit(self._splitter.feed(delta))
+            self._deliver(on_audio, wait=False)
+        self._submit(self._splitter.flush())
+
+    def finish(self, on_audio=None):
+        """
+        Wait for the remaining sentences and pass them to on_audio in
+        order. Returns the whole reply as one audio file, or None if
+        nothing was spoken. Raises the first synthesis error.
+        """
+        try:
+            self._deliver(on_audio, wait=True)
+        finally:
+            reply_log.append({
+                "first_sentence": self._first_sentence,
+                "first_audio": self._first_audio,
+                "total": time.perf_counter() - self._started,
+                "sentences": len(self._futures),
+            })
+        return self.backend.join(self.chunks) if self.chunks else None
+
+
+def voice_stats():
+    """
+    Median and p95 time-to-first-audio over reply_log, measured from the
+    start of the LLM request, and the median time to the first sentence
+    """
+    entries = [e for e in reply_log if e["first_audio"] is not None]
+    if not entries:
+        return {"replies": 0}
+    first_audio = sorted(e["first_audio"] for e in entries)
+    return {
+        "replies": len(entries),
+        "first_audio_p50": first_audio[len(first_audio) // 2],
+        "first_audio_p95": first_audio[min(len(first_audio) - 1, int(len(first_audio) * 0.95))],
+        "first_sentence_p50": float(np.median([e["first_sentence"] for e in entries])),
+        "sentences_avg": float(np.mean([e["sentences"] for e in entries])),
+    }